@@ -2,6 +2,18 @@ import random
 import time
 import os
 import math
+import sys
+import json
+import argparse
+import itertools
+import hashlib
+import re
+import io
+import bisect
+import base64
+import struct
+import collections
+from array import array
 
 class EvolutionSimulator:
     def __init__(self):
@@ -46,28 +58,39 @@ class EvolutionSimulator:
             mysimsetup.update_size()  # Manual setup
             self.__instance_initialisation(mysimsetup)
 
-    def __instance_initialisation(self, mysimsetup, filename = None):
+    def __instance_initialisation(self, mysimsetup, filename = None, seed = None, cycle_hooks = ()):
         if not isinstance(mysimsetup, SimulationSetup):
             raise ValueError("Invalid setup object passed to instance_initialisation.")
-        myvalue_calculator = ValueCalculator(mysimsetup)
+        if mysimsetup.colonies:
+            raise ValueError("Multi-colony setups only run headless, use --headless to run them.")
+        seed = new_seed() if seed is None else seed
+        myvalue_calculator = ValueCalculator(mysimsetup, seed = seed)
         growth_value = myvalue_calculator.calc_growth_value()
         mutation_value = myvalue_calculator.calc_mutation_value()
         mygrid = Grid(mysimsetup) 
         mygrid.print_start()
-        mysimulation = Simulation(PreviousSetup(), mysimsetup, growth_value, mutation_value, filename = filename)
-        mysimulation.simulation_controller(mygrid, mysimulation)
+        mysimulation = Simulation(PreviousSetup(), mysimsetup, growth_value, mutation_value, filename = filename, seed = seed)
+        mysimulation.cycle_hooks.extend(cycle_hooks)
+        myrenderer = TerminalRenderer(mysimsetup.rows, mysimsetup.cols)
+        mysimulation.simulation_controller(mygrid, mysimulation, renderer = myrenderer)
 
     def main(self):
         print("Welcome to the Evolution Simulator!")
         self.__tutorial()
         self.__existing_setup()
 
+    def run(self, mysimsetup, seed = None, cycle_hooks = ()):
+        self.__instance_initialisation(mysimsetup, seed = seed, cycle_hooks = cycle_hooks)
+        #  Shows a ready made setup without the tutorial or setup prompts
+
 class PreviousSetup:
     def __init__(self, filename = None):
         self.filename = filename
 
     def verify_filename(self):
-        filename = input("Enter the file name: ") + ".txt"
+        filename = input("Enter the file name: ")
+        if os.path.splitext(filename)[1].lower() not in SetupFile.EXTENSIONS:
+            filename = filename + ".txt"
         current_directory = os.path.dirname(os.path.abspath(__file__))  # Get directory
         file_path = os.path.join(current_directory, filename)  # Join with the filename 
         print(f"File path: {file_path}")
@@ -83,8 +106,7 @@ class PreviousSetup:
     def get_filename(self):
         filename = self.verify_filename()
         self.filename = filename
-        self.file_setup()
-        return self.filename
+        return self.file_setup()
 
     def file_setup(self, context = None):
         try:
@@ -96,6 +118,8 @@ class PreviousSetup:
             self.the_file = os.path.join(current_directory, self.filename)
             mysimsetup = SimulationSetup()
             self.__load_file(self.the_file, mysimsetup)
+            if mysimsetup.colonies:
+                raise SetupFormatError("multi-colony setups only run headless, use --headless to run them")
             if "tutorial" in self.the_file:
                 print(self.the_file)
                 print(f"Tutorial: {mysimsetup.message_2} \n")
@@ -105,28 +129,330 @@ class PreviousSetup:
         except FileNotFoundError:
             print("File not accessible. Continuing program...")
             return
+        except SetupFormatError as e:
+            print(f"Error processing file '{self.the_file}': {e}")
+            return
+
+    def load(self, path):
+        file_path = path
+        if not os.path.exists(file_path):
+            current_directory = os.path.dirname(os.path.abspath(__file__))
+            file_path = os.path.join(current_directory, path)
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Setup file '{path}' does not exist.")
+        self.the_file = file_path
+        mysimsetup = SimulationSetup()
+        self.__load_file(file_path, mysimsetup)
+        return mysimsetup
+        #  Loads a setup without any prompts, used by headless runs
 
     def __load_file(self, file_path, target_object):
+        SetupFile().read_into(file_path, target_object)
+        #  Format is picked from the extension, errors are raised as SetupFormatError
+
+
+class SetupFormatError(ValueError):
+    pass
+
+
+class SetupFile:
+    FORMAT = "evolution-simulator-setup"
+    VERSION = 1
+    EXTENSIONS = (".txt", ".json", ".toml", ".npz")
+    MODES = ("genotype", "phenotype", "environment")
+    RADIATION = ("xray", "gamma", "particle")
+    ENTITIES = ("start", "nutrients", "obstacles")
+
+    def read(self, file_path):
+        mysimsetup = SimulationSetup()
+        self.read_into(file_path, mysimsetup)
+        return mysimsetup
+
+    def read_into(self, file_path, target_object):
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension == ".json":
+            with open(file_path, "r") as file:
+                try:
+                    data = json.load(file)
+                except json.JSONDecodeError as e:
+                    raise SetupFormatError(f"invalid JSON: {e}") from None
+        elif extension == ".toml":
+            import tomllib
+            with open(file_path, "rb") as file:
+                try:
+                    data = tomllib.load(file)
+                except tomllib.TOMLDecodeError as e:
+                    raise SetupFormatError(f"invalid TOML: {e}") from None
+        elif extension == ".npz":
+            data = self.__read_npz(file_path)
+        else:
+            data = self.__read_legacy(file_path)
+        return self.from_dict(data, target_object)
+
+    def from_dict(self, data, target_object):
+        self.__validate(data)
+        for name in ("rows", "cols", "cycles") + self.MODES:
+            setattr(target_object, name, int(data[name]))
+        for name in self.RADIATION:
+            setattr(target_object, name, float(data[name]))
+        for name in self.ENTITIES:
+            setattr(target_object, name, [(int(row), int(col)) for row, col in data[name]])
+        target_object.colonies = []
+        for colony in data.get("colonies", []):
+            colony = dict(colony)
+            colony["start"] = [(int(row), int(col)) for row, col in colony["start"]]
+            target_object.colonies.append(colony)
+        target_object.neighbourhood = data.get("neighbourhood", "moore")
+        target_object.wrap = data.get("wrap", False)
+        target_object.message_1 = data.get("message_1", "")
+        target_object.message_2 = data.get("message_2", "")
+        return target_object
+
+    def to_dict(self, sim_setup, coordinates = True):
+        data = {"format": self.FORMAT, "version": self.VERSION}
+        for name in ("rows", "cols") + self.MODES + self.RADIATION + ("cycles",):
+            data[name] = getattr(sim_setup, name)
+        for name in ("message_1", "message_2"):
+            if getattr(sim_setup, name, ""):
+                data[name] = getattr(sim_setup, name)
+        if coordinates:
+            for name in self.ENTITIES:
+                data[name] = [list(coordinate) for coordinate in getattr(sim_setup, name)]
+        if getattr(sim_setup, "neighbourhood", "moore") != "moore":
+            data["neighbourhood"] = sim_setup.neighbourhood
+        if getattr(sim_setup, "wrap", False):
+            data["wrap"] = True
+        if getattr(sim_setup, "colonies", None):
+            data["colonies"] = [dict(colony, start = [list(coordinate) for coordinate in colony["start"]]) for colony in sim_setup.colonies]
+        return data
+        #  Colonies are small, so they stay in the metadata even when coordinates are left out
+        #  Neighbourhood settings are only written when changed, so older readers still accept default setups
+
+    def write(self, sim_setup, file_path):
+        data = self.to_dict(sim_setup, coordinates = False)
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension == ".npz":
+            np = require_numpy("Writing .npz setups")
+            arrays = {name: np.array(getattr(sim_setup, name), dtype = np.int32).reshape(-1, 2) for name in self.ENTITIES}
+            np.savez_compressed(file_path, meta = np.array(json.dumps(data)), **arrays)
+        elif extension == ".json":
+            data = self.to_dict(sim_setup)
+            with open(file_path, "w") as file:
+                json.dump(data, file, separators = (",", ":"))
+        else:
+            raise SetupFormatError(f"setups can only be written as .json or .npz, not '{extension}'")
+
+    def read_coordinates(self, file_path):
+        if os.path.splitext(file_path)[1].lower() == ".json":
+            with open(file_path, "r") as file:
+                try:
+                    coordinates = json.load(file)
+                except json.JSONDecodeError as e:
+                    raise SetupFormatError(f"invalid JSON: {e}") from None
+            if not isinstance(coordinates, list) or not all(isinstance(coordinate, list) and len(coordinate) == 2 for coordinate in coordinates):
+                raise SetupFormatError("expected a list of [row, col] pairs")
+            return [tuple(coordinate) for coordinate in coordinates]
+        coordinates = []
+        with open(file_path, "r") as file:
+            for line_number, line in enumerate(file, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("["):
+                    coordinates.extend(self.__parse_coordinates(line, line_number))
+                    continue
+                match = re.fullmatch(r"(-?\d+)\s*[,\s]\s*(-?\d+)", line)
+                if not match:
+                    raise SetupFormatError(f"line {line_number}: expected 'row,col', found '{line}'")
+                coordinates.append((int(match.group(1)), int(match.group(2))))
+        return coordinates
+        #  A .json list of pairs, or one row,col pair per line (a legacy [(row, col), ...] line also works)
+
+    def convert(self, source, destination):
+        self.write(self.read(source), destination)
+        #  Turns old 12 line .txt setups into the versioned format
+
+    def __read_npz(self, file_path):
+        np = require_numpy("Reading .npz setups")
+        with np.load(file_path, allow_pickle = False) as arrays:
+            if "meta" not in arrays:
+                raise SetupFormatError("missing 'meta' entry")
+            data = json.loads(str(arrays["meta"]))
+            for name in self.ENTITIES:
+                if name not in arrays:
+                    raise SetupFormatError(f"missing '{name}' array")
+                data[name] = arrays[name].reshape(-1, 2).tolist()
+        return data
+        #  Coordinates are stored as int32 arrays, much smaller and faster than JSON lists
+
+    def __read_legacy(self, file_path):
+        with open(file_path, "r") as file:
+            lines = [line.strip() for line in file]
+        if len(lines) < 12:
+            raise SetupFormatError(f"expected at least 12 lines, found {len(lines)}")
+        names = ("rows", "cols") + self.MODES + self.RADIATION + self.ENTITIES + ("cycles",)
+        data = {"format": self.FORMAT, "version": self.VERSION}
+        for number, name in enumerate(names):
+            if name in self.ENTITIES:
+                data[name] = self.__parse_coordinates(lines[number], number + 1)
+            else:
+                data[name] = self.__parse_number(lines[number], number + 1, float if name in self.RADIATION else int)
+        if len(lines) > 12:
+            data["message_1"] = lines[-1]  # First part
+            data["message_2"] = lines[-2]  # Second part
+        return data
+        #  Old layout: one value per line in a fixed order, messages on the last two lines
+
+    def __parse_number(self, text, line_number, kind):
         try:
-            # Open the file and read values
-            with open(file_path, 'r') as self.filename:
-                data = self.filename.readlines()
-            target_object.message_1 = str(data[-1].strip()) # First part
-            target_object.message_2 = str(data[-2].strip()) # Second part 
-            target_object.rows = int(data[0].strip())  # Grid rows
-            target_object.cols = int(data[1].strip())  # Grid cols
-            target_object.genotype = int(data[2].strip())  # Genotype
-            target_object.phenotype = int(data[3].strip())  # Phenotype
-            target_object.environment = int(data[4].strip())  # Environment
-            target_object.xray = float(data[5].strip())  # X-ray radiation
-            target_object.gamma = float(data[6].strip())  # Gamma radiation
-            target_object.particle = float(data[7].strip())  # Particle radiation
-            target_object.start = eval(data[8].strip())  # Start coordinates
-            target_object.nutrients = eval(data[9].strip())  # Nutrients
-            target_object.obstacles = eval(data[10].strip())  # Obstacles
-            target_object.cycles = int(data[11].strip())  # Cycles
-        except Exception as e:
-            print(f"Error processing file '{file_path}': {e}")
+            return kind(text)
+        except ValueError:
+            raise SetupFormatError(f"line {line_number}: expected a number, found '{text}'") from None
+
+    def __parse_coordinates(self, text, line_number):
+        if not re.fullmatch(r"\[\s*(\(\s*-?\d+\s*,\s*-?\d+\s*\)\s*,?\s*)*\]", text):
+            raise SetupFormatError(f"line {line_number}: expected a list of (row, col) pairs")
+        numbers = [int(number) for number in re.findall(r"-?\d+", text)]
+        return list(zip(numbers[0::2], numbers[1::2]))
+        #  Replaces eval, only lists of integer pairs are accepted
+
+    def __validate(self, data):
+        if not isinstance(data, dict):
+            raise SetupFormatError("setup must be a mapping of field names to values")
+        if data.get("format", self.FORMAT) != self.FORMAT:
+            raise SetupFormatError(f"not a setup file (format '{data.get('format')}')")
+        version = data.get("version", self.VERSION)
+        if not isinstance(version, int) or version > self.VERSION:
+            raise SetupFormatError(f"setup version {version!r} is not supported (newest is {self.VERSION})")
+        for name in ("rows", "cols", "cycles") + self.MODES + self.RADIATION + self.ENTITIES:
+            if name not in data:
+                raise SetupFormatError(f"missing field '{name}'")
+        ranges = {"rows": (1, None), "cols": (1, None), "cycles": (0, None),
+                  "genotype": (1, 5), "phenotype": (1, 5), "environment": (1, 5)}
+        for name, (low, high) in ranges.items():
+            value = data[name]
+            if not isinstance(value, int) or isinstance(value, bool) or value < low or (high is not None and value > high):
+                raise SetupFormatError(f"'{name}' must be an integer from {low}" + (f" to {high}" if high else " upwards"))
+        for name in self.RADIATION:
+            value = data[name]
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or not 0 <= value <= 1:
+                raise SetupFormatError(f"'{name}' must be a number from 0 to 1")
+        if data.get("neighbourhood", "moore") not in Neighbourhood.KINDS:
+            raise SetupFormatError(f"'neighbourhood' must be one of {', '.join(Neighbourhood.KINDS)}")
+        if not isinstance(data.get("wrap", False), bool):
+            raise SetupFormatError("'wrap' must be true or false")
+        colonies = data.get("colonies", [])
+        if not isinstance(colonies, list) or not all(isinstance(colony, dict) and "start" in colony for colony in colonies):
+            raise SetupFormatError("'colonies' must be a list of mappings, each with a 'start' list")
+        for number, colony in enumerate(colonies):
+            for name, value in colony.items():
+                if name in self.MODES:
+                    if not isinstance(value, int) or isinstance(value, bool) or not 1 <= value <= 5:
+                        raise SetupFormatError(f"colony {number}: '{name}' must be an integer from 1 to 5")
+                elif name in self.RADIATION:
+                    if not isinstance(value, (int, float)) or isinstance(value, bool) or not 0 <= value <= 1:
+                        raise SetupFormatError(f"colony {number}: '{name}' must be a number from 0 to 1")
+                elif name == "name":
+                    if not isinstance(value, str):
+                        raise SetupFormatError(f"colony {number}: 'name' must be text")
+                elif name != "start":
+                    raise SetupFormatError(f"colony {number}: unknown field '{name}'")
+            if not colony["start"]:
+                raise SetupFormatError(f"colony {number}: at least one start coordinate is needed")
+        seen = {}
+        entities = [(name, data[name]) for name in self.ENTITIES]
+        entities.extend((f"colony {number} start", colony["start"]) for number, colony in enumerate(colonies))
+        for name, coordinates in entities:
+            if not isinstance(coordinates, list):
+                raise SetupFormatError(f"'{name}' must be a list of (row, col) pairs")
+            for coordinate in coordinates:
+                if not isinstance(coordinate, (list, tuple)) or len(coordinate) != 2 or not all(isinstance(value, int) for value in coordinate):
+                    raise SetupFormatError(f"'{name}' entries must be (row, col) pairs")
+                row, col = coordinate
+                if not (0 <= row < data["rows"] and 0 <= col < data["cols"]):
+                    raise SetupFormatError(f"'{name}' coordinate {(row, col)} is outside the grid")
+                if seen.setdefault((row, col), name) != name:
+                    raise SetupFormatError(f"{(row, col)} is in both '{seen[(row, col)]}' and '{name}'")
+        if not data["start"]:
+            raise SetupFormatError("at least one start coordinate is needed")
+
+
+class SetupBuilder:
+    def __init__(self, base = None):
+        if base is not None:
+            self.__data = SetupFile().to_dict(base)
+        else:
+            self.__data = {"rows": 10, "cols": 10, "genotype": 5, "phenotype": 5, "environment": 5,
+                           "xray": 0.01, "gamma": 0.01, "particle": 0.01, "cycles": 100,
+                           "start": [], "nutrients": [], "obstacles": []}
+        #  Defaults match a manual setup that answers "no specific change" and "radiation unknown"
+        #  Each method returns the builder so calls can be chained
+
+    def size(self, rows, cols = None):
+        self.__data["rows"] = rows
+        self.__data["cols"] = rows if cols is None else cols
+        return self
+
+    def genotype(self, value):
+        self.__data["genotype"] = value
+        return self
+
+    def phenotype(self, value):
+        self.__data["phenotype"] = value
+        return self
+
+    def environment(self, value):
+        self.__data["environment"] = value
+        return self
+
+    def radiation(self, xray, gamma = None, particle = None):
+        self.__data["xray"] = xray
+        self.__data["gamma"] = xray if gamma is None else gamma
+        self.__data["particle"] = xray if particle is None else particle
+        return self
+        #  One value sets all three
+
+    def start(self, *coordinates):
+        self.__data["start"] = [list(coordinate) for coordinate in coordinates]
+        return self
+
+    def nutrients(self, coordinates):
+        self.__data["nutrients"] = [list(coordinate) for coordinate in coordinates]
+        return self
+
+    def obstacles(self, coordinates):
+        self.__data["obstacles"] = [list(coordinate) for coordinate in coordinates]
+        return self
+
+    def nutrients_file(self, file_path):
+        return self.nutrients(SetupFile().read_coordinates(file_path))
+
+    def obstacles_file(self, file_path):
+        return self.obstacles(SetupFile().read_coordinates(file_path))
+
+    def neighbourhood(self, kind = None, wrap = None):
+        if kind is not None:
+            self.__data["neighbourhood"] = kind
+        if wrap is not None:
+            self.__data["wrap"] = wrap
+        return self
+        #  Settings left as None keep their current value
+
+    def colony(self, start, **settings):
+        self.__data.setdefault("colonies", []).append(dict(settings, start = [list(coordinate) for coordinate in start]))
+        return self
+
+    def cycles(self, value):
+        self.__data["cycles"] = value
+        return self
+
+    def build(self):
+        data = dict(self.__data)
+        if not data["start"]:
+            data["start"] = [[data["rows"] // 2, data["cols"] // 2]]
+        return SetupFile().from_dict(data, SimulationSetup())
+        #  Checked by the same rules as a setup file, mistakes raise SetupFormatError
+        #  Without a start point the colony starts in the middle
 
 
 class SimulationSetup:
@@ -146,7 +472,52 @@ class SimulationSetup:
         self.obstacles = []
         self.__user_obstacles = []
         self.cycles = None
+        self.world = None
+        self.colonies = []
+        self.neighbourhood = "moore"
+        self.wrap = False
         # Setups up all the parameters
+        #  world is an optional ChunkedWorld for grids too big for coordinate lists
+        #  colonies holds extra strains, each a dict with its own start and any settings it changes
+        #  neighbourhood and wrap decide which squares a cell can grow into
+
+    def copy(self):
+        setup_copy = SimulationSetup()
+        for name, value in vars(self).items():
+            if name == "_occupancy_index":
+                continue
+            if isinstance(value, ChunkedWorld):
+                value = value.copy()
+            setattr(setup_copy, name, list(value) if isinstance(value, list) else value)
+        return setup_copy
+        #  Simulation changes start and nutrients in place
+        #  A copy lets the same setup be run many times
+
+    def occupancy_index(self):
+        index = getattr(self, "_occupancy_index", None)
+        if index is None or not index.tracks(self):
+            index = WorldIndex(self) if self.world is not None else OccupancyIndex(self)
+            self._occupancy_index = index
+        return index
+        #  Grid, ValueCalculator and Simulation share one index per setup
+        #  Rebuilt if the coordinate lists have been replaced
+
+    def neighbour_table(self):
+        rows, cols = (self.world.rows, self.world.cols) if self.world is not None else (self.rows, self.cols)
+        return Neighbourhood(rows, cols, getattr(self, "neighbourhood", "moore"), getattr(self, "wrap", False))
+        #  Setups made before these settings existed are read as Moore without wrapping
+
+    def colony_setups(self):
+        colony_setups = []
+        for number, colony in enumerate([{"name": "main", "start": self.start}] + self.colonies):
+            colony_setup = self.copy()
+            colony_setup.colonies = []
+            for name, value in colony.items():
+                if name != "name":
+                    setattr(colony_setup, name, list(value) if name == "start" else value)
+            colony_setups.append((colony.get("name", f"colony {number}"), colony_setup))
+        return colony_setups
+        #  The setup's own start point is the first colony, settings not given by a colony are shared
     
     def clear_console(self):
         time.sleep(0.1)
@@ -256,7 +627,9 @@ class SimulationSetup:
 
     def __update_radiation(self):
         radiation_known = input("Are all X-Ray, Gamma and Particle radiation values known? (y/n): ").lower()
-        update_xray, update_gamma, update_particle = None, None, None
+        while radiation_known not in ["y", "n"]:
+            print("Please enter y or n")
+            radiation_known = input("Are all X-Ray, Gamma and Particle radiation values known? (y/n): ").lower()
         if radiation_known == "y":
             print("X-ray")
             update_xray = self.__radiation_value()
@@ -264,14 +637,11 @@ class SimulationSetup:
             update_gamma = self.__radiation_value()
             print("Particle")
             update_particle = self.__radiation_value()
-        elif radiation_known == "n":
+        else:
             update_xray = 0.01
             update_gamma = 0.01
             update_particle = 0.01
-        else:
-            print("Please enter y or n")
-            self.__update_radiation()
-            return
+        #  Asks again in a loop, recursing on every bad answer could run out of stack
         self.xray = update_xray
         self.gamma = update_gamma
         self.particle = update_particle
@@ -345,7 +715,10 @@ class SimulationSetup:
 
 
 class ValueCalculator(SimulationSetup):
-    def __init__(self, sim_setup):
+    def __init__(self, sim_setup, headless = False, seed = None):
+        self.headless = headless
+        self.seed = new_seed() if seed is None else seed
+        self.rng = random.Random(self.seed)
         self.genotype = sim_setup.genotype
         self.phenotype = sim_setup.phenotype
         self.environment = sim_setup.environment
@@ -353,8 +726,10 @@ class ValueCalculator(SimulationSetup):
         self.gamma = sim_setup.gamma
         self.particle = sim_setup.particle
         self.start = sim_setup.start
-        self.nutrients = sim_setup.nutrients
         self.rows = sim_setup.rows
+        self.index = sim_setup.occupancy_index()
+        self.neighbours = sim_setup.neighbour_table()
+        self.nutrients = self.index.nutrients
         self._growth_value_cached = None 
         self.growth_value = None
         self.mutation_value = None
@@ -371,20 +746,11 @@ class ValueCalculator(SimulationSetup):
     
     def __find_nutrients(self): 
         try:
-            self.temporary = random.choice(self.start)
-            print(f"Selected starting point: {self.temporary}")
-            xc, yc = self.temporary
-            nutrients_found = 0
-            for i in range(-1, 2):  
-                for j in range(-1, 2):
-                    if i == 0 and j == 0:
-                        continue
-                    xn = xc + i
-                    yn = yc + j
-                    # Ensure the coordinates are valid
-                    if 0 <= xn < self.rows and 0 <= yn < self.rows:
-                        if (xn, yn) in self.nutrients:
-                            nutrients_found += 1
+            self.temporary = self.index.random_cell(self.rng)
+            if not self.headless:
+                print(f"Selected starting point: {self.temporary}")
+            nutrients_found = sum(1 for square in self.neighbours.neighbours(self.temporary) if self.index.is_nutrient(square))
+            #  The neighbour table only holds squares on the grid
             #  print(f"Nutrients found near {self.temporary}: {nutrients_found}")
             return nutrients_found
         except Exception as e:
@@ -402,11 +768,12 @@ class ValueCalculator(SimulationSetup):
             phenotype_value = phenotypes.get(self.phenotype, 0)
             environment_value = environments.get(self.environment, 0)
             corresponding_array = [genotype_value, phenotype_value, environment_value]
-            nutrient_value = (self.__find_nutrients()) / 8
+            nutrient_value = (self.__find_nutrients()) / len(self.neighbours.offsets)
             corresponding_array.append(nutrient_value)
             total = sum(self.__sigmoid(value) for value in corresponding_array)
             mean = total / len(corresponding_array)
-            print(f"Final growth value: {mean}")
+            if not self.headless:
+                print(f"Final growth value: {mean}")
             self._growth_value_cached = mean 
             return mean
         except ZeroDivisionError:
@@ -422,11 +789,653 @@ class ValueCalculator(SimulationSetup):
             print(f"Error during mutation value calculation: {e}")
             return 0
 
+class OccupancyIndex:
+    def __init__(self, setup):
+        self.rows = setup.rows
+        self.cols = setup.cols
+        self.cells = setup.start
+        self.nutrients = setup.nutrients
+        self.obstacles = setup.obstacles
+        self.cells[:] = list(dict.fromkeys(self.cells))
+        self.nutrients[:] = list(dict.fromkeys(self.nutrients))
+        self.__cell_set = set(self.cells)
+        self.__nutrient_positions = {coordinate: i for i, coordinate in enumerate(self.nutrients)}
+        self.__obstacle_set = set(self.obstacles)
+        #  Works on the setup lists in place so saving still sees the final state
+        #  Duplicate start coordinates are removed so each cell is picked fairly
+
+    def tracks(self, setup):
+        return self.cells is setup.start and self.nutrients is setup.nutrients and self.obstacles is setup.obstacles
+
+    def is_cell(self, coordinate):
+        return coordinate in self.__cell_set
+
+    def is_nutrient(self, coordinate):
+        return coordinate in self.__nutrient_positions
+
+    def is_obstacle(self, coordinate):
+        return coordinate in self.__obstacle_set
+
+    def is_free(self, coordinate):
+        return coordinate not in self.__cell_set and coordinate not in self.__obstacle_set
+
+    def add_cell(self, coordinate):
+        if coordinate not in self.__cell_set:
+            self.__cell_set.add(coordinate)
+            self.cells.append(coordinate)
+
+    def consume_nutrient(self, coordinate):
+        position = self.__nutrient_positions.pop(coordinate, None)
+        if position is None:
+            return False
+        last = self.nutrients.pop()
+        if position < len(self.nutrients):
+            self.nutrients[position] = last
+            self.__nutrient_positions[last] = position
+        return True
+        #  Swaps the last nutrient into the gap instead of shifting the list
+
+    def random_cell(self, rng):
+        return rng.choice(self.cells)
+
+    def random_cell_id(self, rng):
+        return rng.randrange(len(self.cells))
+        #  Cells are never removed, so a cell's position in the list doubles as its id
+
+    def cell_count(self):
+        return len(self.cells)
+
+    def nutrient_count(self):
+        return len(self.nutrients)
+
+    def in_bounds(self, coordinate):
+        return 0 <= coordinate[0] < self.rows and 0 <= coordinate[1] < self.cols
+
+    def area(self):
+        return self.rows * self.cols
+
+
+class Neighbourhood:
+    KINDS = {
+        "moore": ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)),
+        "von-neumann": ((-1, 0), (0, -1), (0, 1), (1, 0)),
+    }
+    CACHE_SQUARES = 1 << 14
+
+    def __init__(self, rows = None, cols = None, kind = "moore", wrap = False):
+        if kind not in self.KINDS:
+            raise ValueError(f"unknown neighbourhood '{kind}', expected one of {', '.join(self.KINDS)}")
+        if wrap and (rows is None or cols is None):
+            raise ValueError("Wrapped edges need a grid with a fixed size.")
+        self.rows = rows
+        self.cols = cols
+        self.kind = kind
+        self.wrap = wrap
+        self.offsets = self.KINDS[kind]
+        self.masks = []
+        for row_edge in range(4):
+            for col_edge in range(4):
+                self.masks.append(tuple(self.__allowed(row_edge, row) and self.__allowed(col_edge, col) for row, col in self.offsets))
+        self.__tables = [tuple(offset for offset, allowed in zip(self.offsets, mask) if allowed) for mask in self.masks]
+        self.__squares = {}
+        #  Squares are sorted into 16 edge classes, 4 for the row (inside, first, last, only) times 4 for the column
+        #  masks holds which offsets stay on the grid for each class, so no move is ever clamped back inside
+        #  Unbounded worlds and wrapped grids only use the inside class
+
+    def __allowed(self, edge, offset):
+        return not ((edge & 1 and offset < 0) or (edge & 2 and offset > 0))
+
+    def edge_class(self, row, col):
+        if self.wrap:
+            return 0
+        row_edge = 0 if self.rows is None else (row == 0) | ((row == self.rows - 1) << 1)
+        col_edge = 0 if self.cols is None else (col == 0) | ((col == self.cols - 1) << 1)
+        return row_edge * 4 + col_edge
+
+    def neighbours(self, coordinate):
+        row, col = coordinate
+        if self.wrap:
+            squares = {((row + dr) % self.rows, (col + dc) % self.cols) for dr, dc in self.offsets}
+            squares.discard(coordinate)
+            return sorted(squares)
+            #  Tiny wrapped grids reach the same square from two sides, it only counts once
+        return [(row + dr, col + dc) for dr, dc in self.__tables[self.edge_class(row, col)]]
+
+    def free_neighbours(self, coordinate, index):
+        squares = self.__squares.get(coordinate)
+        if squares is None:
+            squares = tuple(self.neighbours(coordinate))
+            if len(self.__squares) < self.CACHE_SQUARES:
+                self.__squares[coordinate] = squares
+        is_free = index.is_free
+        return [square for square in squares if is_free(square)]
+        #  Empty and nutrient squares, the only places an expansion can go
+        #  Neighbour lists of the first CACHE_SQUARES squares asked about are kept, cells are picked again and again
+
+    def choose_free(self, np, rng, rows, cols, free_grid):
+        offsets = np.array(self.offsets)
+        xn = rows[:, None] + offsets[:, 0]
+        yn = cols[:, None] + offsets[:, 1]
+        if self.wrap:
+            xn = xn % self.rows
+            yn = yn % self.cols
+            candidates = np.ones(xn.shape, dtype = bool)
+        else:
+            edges = ((rows == 0) | ((rows == self.rows - 1) << 1)) * 4 + ((cols == 0) | ((cols == self.cols - 1) << 1))
+            candidates = np.array(self.masks, dtype = bool)[edges]
+            xn = np.clip(xn, 0, self.rows - 1)
+            yn = np.clip(yn, 0, self.cols - 1)
+        candidates &= free_grid[xn, yn]
+        keys = np.where(candidates, rng.random(candidates.shape), -1.0)
+        picked = keys.argmax(axis = 1)
+        cells = np.arange(rows.size)
+        moved = candidates[cells, picked]
+        return np.where(moved, xn[cells, picked], rows), np.where(moved, yn[cells, picked], cols)
+        #  The same choice as free_neighbours for every cell at once, the highest random key among the free squares wins
+        #  A cell with no free neighbour gets its own square back, which the engine treats as a blocked move
+
+    def any_free(self, np, cell_grid, free_grid):
+        for dr, dc in self.offsets:
+            if self.wrap:
+                reached = np.roll(cell_grid, (dr, dc), axis = (0, 1))
+            else:
+                reached = np.zeros_like(cell_grid)
+                target = (slice(max(dr, 0), self.rows + min(dr, 0)), slice(max(dc, 0), self.cols + min(dc, 0)))
+                source = (slice(max(-dr, 0), self.rows + min(-dr, 0)), slice(max(-dc, 0), self.cols + min(-dc, 0)))
+                reached[target] = cell_grid[source]
+            if (reached & free_grid).any():
+                return True
+        return False
+        #  Shifts the whole cell grid by each offset, True as soon as a shifted cell lands on a free square
+
+
+class ChunkedWorld:
+    EMPTY = 0
+    CELL = 1
+    NUTRIENT = 2
+    OBSTACLE = 3
+
+    def __init__(self, rows = None, cols = None, chunk_bits = 6):
+        self.rows = rows
+        self.cols = cols
+        self.chunk_bits = chunk_bits
+        self.chunk_size = 1 << chunk_bits
+        self.chunks = {}
+        self.counts = [0, 0, 0, 0]
+        self.__mask = self.chunk_size - 1
+        self.__dense_after = (self.chunk_size * self.chunk_size) // 64
+        #  Squares are grouped into chunks, only chunks with something in them are stored
+        #  A chunk starts as a dict of its filled squares and becomes a bytearray once it fills up
+        #  rows and cols of None make the world unbounded in that direction
+
+    def get(self, row, col):
+        chunk = self.chunks.get((row >> self.chunk_bits, col >> self.chunk_bits))
+        if chunk is None:
+            return 0
+        offset = ((row & self.__mask) << self.chunk_bits) | (col & self.__mask)
+        if type(chunk) is dict:
+            return chunk.get(offset, 0)
+        return chunk[offset]
+
+    def set(self, row, col, state):
+        key = (row >> self.chunk_bits, col >> self.chunk_bits)
+        offset = ((row & self.__mask) << self.chunk_bits) | (col & self.__mask)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            if state == self.EMPTY:
+                return
+            chunk = self.chunks[key] = {}
+        if type(chunk) is dict:
+            previous = chunk.pop(offset, 0)
+            if state != self.EMPTY:
+                chunk[offset] = state
+                if len(chunk) > self.__dense_after:
+                    dense = bytearray(self.chunk_size * self.chunk_size)
+                    for position, value in chunk.items():
+                        dense[position] = value
+                    self.chunks[key] = dense
+            elif not chunk:
+                del self.chunks[key]
+        else:
+            previous = chunk[offset]
+            chunk[offset] = state
+        self.counts[previous] = self.counts[previous] - 1
+        self.counts[state] = self.counts[state] + 1
+        self.counts[self.EMPTY] = 0
+        #  Empty squares are not counted, area() covers them
+
+    def in_bounds(self, row, col):
+        return (self.rows is None or 0 <= row < self.rows) and (self.cols is None or 0 <= col < self.cols)
+
+    def area(self):
+        if self.rows is not None and self.cols is not None:
+            return self.rows * self.cols
+        return len(self.chunks) * self.chunk_size * self.chunk_size
+        #  An unbounded world counts only the chunks in use
+
+    def coordinates(self, state):
+        for (chunk_row, chunk_col), chunk in self.chunks.items():
+            if type(chunk) is dict:
+                offsets = [offset for offset, value in chunk.items() if value == state]
+            else:
+                offsets = self.__find_all(chunk, state)
+            for offset in offsets:
+                yield ((chunk_row << self.chunk_bits) | (offset >> self.chunk_bits),
+                       (chunk_col << self.chunk_bits) | (offset & self.__mask))
+
+    def __find_all(self, chunk, state):
+        offset = chunk.find(state)
+        while offset != -1:
+            yield offset
+            offset = chunk.find(state, offset + 1)
+        #  bytearray.find skips the squares in between at C speed
+
+    def nbytes(self):
+        total = 0
+        for chunk in self.chunks.values():
+            total = total + (len(chunk) * 100 if type(chunk) is dict else len(chunk))
+        return total
+        #  Rough figure, dict chunks are counted at about 100 bytes a square
+
+    def copy(self):
+        world_copy = ChunkedWorld(self.rows, self.cols, self.chunk_bits)
+        world_copy.chunks = {key: (dict(chunk) if type(chunk) is dict else bytearray(chunk)) for key, chunk in self.chunks.items()}
+        world_copy.counts = list(self.counts)
+        return world_copy
+
+    def region(self, region = None):
+        if region is not None:
+            return region
+        if self.rows is None or self.cols is None:
+            raise ValueError("An unbounded world needs a region (row, col, rows, cols) to generate into.")
+        return (0, 0, self.rows, self.cols)
+
+    def scatter(self, state, density, rng, region = None):
+        top, left, rows, cols = self.region(region)
+        for chunk_top in range(top, top + rows, self.chunk_size):
+            for chunk_left in range(left, left + cols, self.chunk_size):
+                height = min(self.chunk_size, top + rows - chunk_top)
+                width = min(self.chunk_size, left + cols - chunk_left)
+                for position in rng.sample(range(height * width), round(density * height * width)):
+                    row = chunk_top + position // width
+                    col = chunk_left + position % width
+                    if self.get(row, col) == self.EMPTY:
+                        self.set(row, col, state)
+        #  Samples a fixed count per block rather than rolling for every square
+
+    def add_clusters(self, state, count, radius, density, rng, region = None):
+        top, left, rows, cols = self.region(region)
+        for i in range(count):
+            centre_row = rng.randrange(top, top + rows)
+            centre_col = rng.randrange(left, left + cols)
+            for row in range(centre_row - radius, centre_row + radius + 1):
+                for col in range(centre_col - radius, centre_col + radius + 1):
+                    if (row - centre_row) ** 2 + (col - centre_col) ** 2 > radius * radius:
+                        continue
+                    if self.in_bounds(row, col) and rng.random() < density and self.get(row, col) == self.EMPTY:
+                        self.set(row, col, state)
+
+    def add_walls(self, count, length, rng, gap = 3, region = None):
+        top, left, rows, cols = self.region(region)
+        for i in range(count):
+            row = rng.randrange(top, top + rows)
+            col = rng.randrange(left, left + cols)
+            horizontal = rng.random() < 0.5
+            opening = rng.randrange(max(1, length - gap))
+            for step in range(length):
+                if opening <= step < opening + gap:
+                    continue
+                wall_row, wall_col = (row, col + step) if horizontal else (row + step, col)
+                if self.in_bounds(wall_row, wall_col) and self.get(wall_row, wall_col) == self.EMPTY:
+                    self.set(wall_row, wall_col, self.OBSTACLE)
+        #  Each wall has a gap so colonies can still get past it
+
+    def to_dict(self):
+        chunks = []
+        for (chunk_row, chunk_col), chunk in self.chunks.items():
+            if type(chunk) is dict:
+                chunks.append([chunk_row, chunk_col, "sparse", [[offset, value] for offset, value in chunk.items()]])
+            else:
+                chunks.append([chunk_row, chunk_col, "dense", base64.b64encode(bytes(chunk)).decode()])
+        return {"rows": self.rows, "cols": self.cols, "chunk_bits": self.chunk_bits, "counts": self.counts, "chunks": chunks}
+
+    def load(self, data):
+        self.counts = list(data["counts"])
+        for chunk_row, chunk_col, kind, values in data["chunks"]:
+            if kind == "sparse":
+                self.chunks[(chunk_row, chunk_col)] = {offset: value for offset, value in values}
+            else:
+                self.chunks[(chunk_row, chunk_col)] = bytearray(base64.b64decode(values))
+        return self
+
+
+class WorldView:
+    def __init__(self, world, state):
+        self.world = world
+        self.state = state
+
+    def __len__(self):
+        return self.world.counts[self.state]
+
+    def __iter__(self):
+        return self.world.coordinates(self.state)
+        #  Lets code written for coordinate lists loop over a world's nutrients or obstacles
+
+
+class WorldIndex:
+    def __init__(self, setup):
+        self.world = setup.world
+        self.rows = setup.world.rows
+        self.cols = setup.world.cols
+        self.cells = setup.start
+        self.cells[:] = list(dict.fromkeys(self.cells))
+        for row, col in self.cells:
+            self.world.set(row, col, ChunkedWorld.CELL)
+        self.nutrients = WorldView(self.world, ChunkedWorld.NUTRIENT)
+        self.obstacles = WorldView(self.world, ChunkedWorld.OBSTACLE)
+        #  Same methods as OccupancyIndex, but the world holds every square's state
+        #  Only the live cell list grows with the colony, for picking cells at random
+
+    def tracks(self, setup):
+        return self.cells is setup.start and self.world is setup.world
+
+    def is_cell(self, coordinate):
+        return self.world.get(coordinate[0], coordinate[1]) == ChunkedWorld.CELL
+
+    def is_nutrient(self, coordinate):
+        return self.world.get(coordinate[0], coordinate[1]) == ChunkedWorld.NUTRIENT
+
+    def is_obstacle(self, coordinate):
+        return self.world.get(coordinate[0], coordinate[1]) == ChunkedWorld.OBSTACLE
+
+    def is_free(self, coordinate):
+        state = self.world.get(coordinate[0], coordinate[1])
+        return state == ChunkedWorld.EMPTY or state == ChunkedWorld.NUTRIENT
+
+    def add_cell(self, coordinate):
+        if self.world.get(coordinate[0], coordinate[1]) != ChunkedWorld.CELL:
+            self.world.set(coordinate[0], coordinate[1], ChunkedWorld.CELL)
+            self.cells.append(coordinate)
+
+    def consume_nutrient(self, coordinate):
+        if self.world.get(coordinate[0], coordinate[1]) == ChunkedWorld.NUTRIENT:
+            self.world.set(coordinate[0], coordinate[1], ChunkedWorld.EMPTY)
+            return True
+        return False
+        #  A cell placed on a nutrient has already replaced it, so there is nothing left to remove
+
+    def random_cell(self, rng):
+        return rng.choice(self.cells)
+
+    def random_cell_id(self, rng):
+        return rng.randrange(len(self.cells))
+
+    def cell_count(self):
+        return len(self.cells)
+
+    def nutrient_count(self):
+        return self.world.counts[ChunkedWorld.NUTRIENT]
+
+    def in_bounds(self, coordinate):
+        return self.world.in_bounds(coordinate[0], coordinate[1])
+
+    def area(self):
+        return self.world.area()
+
+
+class ColonyIndex:
+    def __init__(self, setup, colony_starts):
+        self.rows = setup.rows
+        self.cols = setup.cols
+        self.nutrients = setup.nutrients
+        self.obstacles = setup.obstacles
+        self.nutrients[:] = list(dict.fromkeys(self.nutrients))
+        self.owner = {}
+        self.cells = []
+        self.__positions = []
+        for colony_id, start in enumerate(colony_starts):
+            self.cells.append([])
+            self.__positions.append({})
+            for coordinate in start:
+                if coordinate not in self.owner:
+                    self.add_cell(coordinate, colony_id)
+        self.__nutrient_positions = {coordinate: i for i, coordinate in enumerate(self.nutrients)}
+        self.__obstacle_set = set(self.obstacles)
+        #  owner maps every occupied square to its colony, so a move needs one lookup whatever the colony count
+        #  Each colony keeps its own cell list for picking cells and a position map for taking cells away
+
+    def owner_of(self, coordinate):
+        return self.owner.get(coordinate)
+
+    def is_nutrient(self, coordinate):
+        return coordinate in self.__nutrient_positions
+
+    def is_obstacle(self, coordinate):
+        return coordinate in self.__obstacle_set
+
+    def add_cell(self, coordinate, colony_id):
+        self.owner[coordinate] = colony_id
+        self.__positions[colony_id][coordinate] = len(self.cells[colony_id])
+        self.cells[colony_id].append(coordinate)
+
+    def take_cell(self, coordinate, colony_id):
+        loser = self.owner[coordinate]
+        cells = self.cells[loser]
+        positions = self.__positions[loser]
+        position = positions.pop(coordinate)
+        last = cells.pop()
+        if position < len(cells):
+            cells[position] = last
+            positions[last] = position
+        self.add_cell(coordinate, colony_id)
+        return loser
+        #  Swaps the loser's last cell into the gap, the same as consume_nutrient
+
+    def consume_nutrient(self, coordinate):
+        position = self.__nutrient_positions.pop(coordinate, None)
+        if position is None:
+            return False
+        last = self.nutrients.pop()
+        if position < len(self.nutrients):
+            self.nutrients[position] = last
+            self.__nutrient_positions[last] = position
+        return True
+
+    def random_cell(self, colony_id, rng):
+        return rng.choice(self.cells[colony_id])
+
+    def cell_count(self, colony_id = None):
+        if colony_id is None:
+            return len(self.owner)
+        return len(self.cells[colony_id])
+
+    def nutrient_count(self):
+        return len(self.nutrients)
+
+    def in_bounds(self, coordinate):
+        return 0 <= coordinate[0] < self.rows and 0 <= coordinate[1] < self.cols
+
+    def area(self):
+        return self.rows * self.cols
+
+
+def world_setup(template, rows, cols, nutrient_density = 0.05, obstacle_density = 0.02, clusters = 0,
+                cluster_radius = 8, walls = 0, wall_length = 50, seed = 0, region = None):
+    mysimsetup = template.copy()
+    mysimsetup.rows = rows
+    mysimsetup.cols = cols
+    world = ChunkedWorld(rows, cols)
+    if region is None and (rows is None or cols is None):
+        region = (-500, -500, 1000, 1000)
+    top, left, height, width = world.region(region)
+    mysimsetup.start = [(top + height // 2, left + width // 2)]
+    world.set(top + height // 2, left + width // 2, ChunkedWorld.CELL)
+    layout_random = random.Random(seed)
+    world.add_walls(walls, wall_length, layout_random, region = region)
+    world.add_clusters(ChunkedWorld.NUTRIENT, clusters, cluster_radius, 0.6, layout_random, region = region)
+    world.scatter(ChunkedWorld.OBSTACLE, obstacle_density, layout_random, region = region)
+    world.scatter(ChunkedWorld.NUTRIENT, nutrient_density, layout_random, region = region)
+    mysimsetup.nutrients = []
+    mysimsetup.obstacles = []
+    mysimsetup.world = world
+    return mysimsetup
+    #  Builds a large or unbounded setup from the template's genotype, radiation and cycles
+    #  The colony starts in the middle of the generated area
+
+
+class CellGenomes:
+    def __init__(self, count, growth_value):
+        self.growth = array("d", [growth_value]) * count
+        self.mutations = array("I", [0]) * count
+        self.parent = array("i", [-1]) * count
+        self.lineage = array("i", range(count))
+        self.__growth_total = growth_value * count
+        #  One array per field instead of an object per cell, about 20 bytes a cell
+        #  Founder cells have no parent and start their own lineage
+
+    def add_daughter(self, parent_id, growth_value):
+        self.growth.append(growth_value)
+        self.mutations.append(self.mutations[parent_id])
+        self.parent.append(parent_id)
+        self.lineage.append(self.lineage[parent_id])
+        self.__growth_total = self.__growth_total + growth_value
+        return len(self.growth) - 1
+        #  Daughters start as a copy of their parent, mutations included
+
+    def set_growth(self, cell_id, growth_value):
+        self.__growth_total = self.__growth_total + growth_value - self.growth[cell_id]
+        self.growth[cell_id] = growth_value
+
+    def shift_growth(self, change):
+        for cell_id in range(len(self.growth)):
+            self.growth[cell_id] = self.growth[cell_id] + change
+        self.__growth_total = self.__growth_total + change * len(self.growth)
+
+    def mean_growth(self):
+        return self.__growth_total / len(self.growth) if self.growth else 0.0
+
+    def nbytes(self):
+        return sum(values.itemsize * len(values) for values in (self.growth, self.mutations, self.parent, self.lineage))
+
+    def summary(self):
+        lineages = {}
+        for lineage in self.lineage:
+            lineages[lineage] = lineages.get(lineage, 0) + 1
+        return {
+            "cells": len(self.growth),
+            "lineages": lineages,
+            "growth_min": min(self.growth) if self.growth else None,
+            "growth_max": max(self.growth) if self.growth else None,
+            "max_mutations": max(self.mutations) if self.mutations else 0,
+            "bytes": self.nbytes(),
+        }
+
+    def to_dict(self):
+        return {"growth": list(self.growth), "mutations": list(self.mutations),
+                "parent": list(self.parent), "lineage": list(self.lineage), "growth_total": self.__growth_total}
+        #  The running total is kept as is, summing growth again would round differently and change mean_growth
+
+    def load(self, data):
+        self.growth = array("d", data["growth"])
+        self.mutations = array("I", data["mutations"])
+        self.parent = array("i", data["parent"])
+        self.lineage = array("i", data["lineage"])
+        self.__growth_total = data["growth_total"] if "growth_total" in data else math.fsum(self.growth)
+        #  Checkpoints from before growth_total was saved fall back to summing
+
+
+class NutrientField:
+    def __init__(self, rows, cols, nutrients = (), obstacles = (), capacity = 1.0, initial = 0.5, diffusion = 0.1,
+                 regrowth = 0.01, consumption = 0.5, every = 1):
+        np = require_numpy("The nutrient field")
+        self.np = np
+        if not 0 <= diffusion <= 0.25:
+            raise ValueError("diffusion must be between 0 and 0.25 for the field to stay stable")
+        self.capacity = capacity
+        self.diffusion = diffusion
+        self.regrowth = regrowth
+        self.consumption = consumption
+        self.every = every
+        self.steps = 0
+        self.level = np.full((rows, cols), float(initial))
+        self.blocked = np.zeros((rows, cols), dtype = bool)
+        for row, col in nutrients:
+            self.level[row, col] = capacity
+        for row, col in obstacles:
+            self.blocked[row, col] = True
+        self.level[self.blocked] = 0.0
+        open_squares = np.zeros((rows + 2, cols + 2))
+        open_squares[1:-1, 1:-1] = ~self.blocked
+        self.__open_neighbours = (open_squares[:-2, 1:-1] + open_squares[2:, 1:-1]
+                                  + open_squares[1:-1, :-2] + open_squares[1:-1, 2:])
+        self.__scale = diffusion * open_squares[1:-1, 1:-1]
+        self.__padded = np.zeros((rows + 2, cols + 2))
+        self.__change = np.empty((rows, cols))
+        self.__outflow = np.empty((rows, cols))
+        self.__ticks = 0
+        #  Concentration of food on every square, nutrient points start full
+        #  Buffers are made once so a step does not allocate new arrays
+        #  Obstacles are kept at zero and left out of the stencil, like the grid edges
+
+    def tick(self):
+        self.__ticks = self.__ticks + 1
+        if self.__ticks >= self.every:
+            self.__ticks = 0
+            self.step()
+        #  Lets the sequential engine, which only moves one cell a cycle, update the field less often
+
+    def step(self):
+        np = self.np
+        level = self.level
+        padded = self.__padded
+        change = self.__change
+        padded[1:-1, 1:-1] = level
+        np.add(padded[:-2, 1:-1], padded[2:, 1:-1], out = change)
+        change += padded[1:-1, :-2]
+        change += padded[1:-1, 2:]
+        np.multiply(self.__open_neighbours, level, out = self.__outflow)
+        change -= self.__outflow
+        change *= self.__scale
+        level += change
+        #  Five point stencil: each square moves towards the average of its open neighbours
+        #  The border of the padding and every obstacle hold zero and are not counted as neighbours,
+        #  so no food flows into or out of them and the total only changes through regrowth and eating
+        level += self.regrowth * (self.capacity - level)
+        level[self.blocked] = 0.0
+        self.steps = self.steps + 1
+
+    def factor(self, row, col):
+        return self.level[row, col] / self.capacity
+        #  Scales growth chance by how much food is left where the cell would grow
+
+    def consume(self, row, col):
+        taken = self.level[row, col] * self.consumption
+        self.level[row, col] = self.level[row, col] - taken
+        return taken
+        #  Works on single squares or arrays of squares
+
+    def to_dict(self):
+        return {"capacity": self.capacity, "diffusion": self.diffusion, "regrowth": self.regrowth,
+                "consumption": self.consumption, "every": self.every, "steps": self.steps, "ticks": self.__ticks,
+                "level": self.level.tolist(), "blocked": self.np.argwhere(self.blocked).tolist()}
+
+    def load(self, data):
+        self.level[:] = self.np.array(data["level"])
+        self.steps = data["steps"]
+        self.__ticks = data["ticks"]
+
+
+def create_nutrient_field(sim_setup, options):
+    options = dict(options or {})
+    return NutrientField(sim_setup.rows, sim_setup.cols, sim_setup.nutrients, sim_setup.obstacles, **options)
+
+
 class Grid:
     def __init__(self, setup):
         self.rows = setup.rows
         self.cols = setup.cols
         self.__grid = [["-" for i in range(self.cols)] for i in range(self.rows)]
+        self.index = setup.occupancy_index()
         self.start = setup.start
         self.nutrients = setup.nutrients
         self.obstacles = setup.obstacles
@@ -450,15 +1459,75 @@ class Grid:
         for row in self.__grid:
             print(" ".join(row))
 
+    def frame(self):
+        frame = [bytearray(b"-" * self.cols) for i in range(self.rows)]
+        for row, col in self.index.cells:
+            frame[row][col] = 69  # E
+        for row, col in self.index.nutrients:
+            frame[row][col] = 78  # N
+        for row, col in self.index.obstacles:
+            frame[row][col] = 79  # O
+        return [row.decode() for row in frame]
+        #  Same symbols as print_start but returned as one string per row for TerminalRenderer
+
+
+class TerminalRenderer:
+    def __init__(self, rows, cols, max_fps = 30, stream = None):
+        self.rows = rows
+        self.cols = cols
+        self.stream = stream or sys.stdout
+        self.interval = 1 / max_fps if max_fps else 0
+        self.frames_drawn = 0
+        self.__last_frame = None
+        self.__last_status = []
+        self.__last_draw = 0
+        if os.name == 'nt':
+            os.system('')
+        #  Empty command switches on ANSI escape codes in the Windows console
+
+    def due(self):
+        return self.__last_frame is None or time.perf_counter() - self.__last_draw >= self.interval
+        #  Lets the caller skip building a frame that would not be drawn
+
+    def draw(self, frame, status = (), force = False):
+        if not force and not self.due():
+            return False
+        parts = []
+        if self.__last_frame is None:
+            parts.append("\x1b[2J")
+            for row, line in enumerate(frame):
+                parts.append(f"\x1b[{row + 1};1H{' '.join(line)}")
+        else:
+            for row, (line, last_line) in enumerate(zip(frame, self.__last_frame)):
+                if line == last_line:
+                    continue
+                for col, (cell, last_cell) in enumerate(zip(line, last_line)):
+                    if cell != last_cell:
+                        parts.append(f"\x1b[{row + 1};{col * 2 + 1}H{cell}")
+        #  Only cells that changed since the last frame are redrawn
+        for position, line in enumerate(status):
+            if position >= len(self.__last_status) or self.__last_status[position] != line:
+                parts.append(f"\x1b[{self.rows + position + 2};1H{line}\x1b[K")
+        parts.append(f"\x1b[{self.rows + len(status) + 2};1H")
+        self.stream.write("".join(parts))
+        self.stream.flush()
+        self.__last_frame = list(frame)
+        self.__last_status = list(status)
+        self.__last_draw = time.perf_counter()
+        self.frames_drawn = self.frames_drawn + 1
+        return True
+        #  Each frame goes out as a single write
+
 class Simulation(ValueCalculator, EvolutionSimulator):
-    def __init__(self, previous_setup, sim_setup, growth_value, mutation_value, filename = None):
-        super().__init__(sim_setup)
+    def __init__(self, previous_setup, sim_setup, growth_value, mutation_value, filename = None, headless = False, seed = None,
+                 per_cell_growth = False, nutrient_field = None):
+        super().__init__(sim_setup, headless = headless, seed = seed)
         self.previous_setup = previous_setup
         self.filename = filename
         self.sim_setup = sim_setup
         self.start = sim_setup.start
-        self.nutrients = sim_setup.nutrients
-        self.obstacles = sim_setup.obstacles
+        self.nutrients = self.index.nutrients
+        self.obstacles = self.index.obstacles
         self.cycles = sim_setup.cycles
         self.growth_value = growth_value
         self.mutation_value = mutation_value
@@ -468,22 +1537,43 @@ class Simulation(ValueCalculator, EvolutionSimulator):
         self.mutation_count = 0
         self.survival_chance = 3
         self.cycle_count = 0
+        self.original_growth_value = growth_value
+        self.genomes = CellGenomes(self.index.cell_count(), growth_value) if per_cell_growth else None
+        self.__working_id = None
+        self.nutrient_field = nutrient_field
+        self.cycle_hooks = []
+        self.stop_reason = None
+        self.renderer = None
+        self.__message = ""
 
-    def simulation_controller(self, mygrid, mysimulation):
+    def simulation_controller(self, mygrid, mysimulation, renderer = None):
         original = self.growth_value
         cycles = self.cycles
+        self.renderer = renderer
         for i in range(cycles):
             self.__entity_cell()
-            self.clear_console()
-            print(mygrid.print_start())
-            print(f"Current cycle count: {(i+1)}")
-            print(f"Current mutation count: {self.mutation_count}")
-            if self.__negative_value:
+            self.cycle_count = (i+1)
+            for hook in self.cycle_hooks:
+                hook(self)
+            if renderer is None:
+                self.clear_console()
+                print(mygrid.print_start())
+                print(f"Current cycle count: {(i+1)}")
+                print(f"Current mutation count: {self.mutation_count}")
+            elif renderer.due():
+                renderer.draw(mygrid.frame(), self.__status(i+1))
+            #  With a renderer the cycles run at full speed, the renderer alone limits how often a frame is drawn
+            if self.__negative_value or self.stop_reason is not None:
                 break
+        if renderer is not None:
+            renderer.draw(mygrid.frame(), self.__status(i+1), force = True)
+            self.renderer = None
         self.clear_console()
         print("Final grid: ")
         print(mygrid.print_start())
         print(f"Final Cycle count: {(i+1)}")
+        if self.stop_reason is not None:
+            print(f"Stopped early: {self.stop_reason}")
         self.cycle_count = (i+1)
         print(f"Final Mutation count: {self.mutation_count}")
         print(f"Original growth value: {round(original, 4)}")
@@ -493,75 +1583,191 @@ class Simulation(ValueCalculator, EvolutionSimulator):
             return
         saving = SaveSimulation(self.sim_setup, mysimulation, self.previous_setup)
         saving.save_simulation()
-    
+
+    def run_headless(self):
+        for i in range(self.cycle_count, self.cycles):
+            if self.__negative_value or self.stop_reason is not None:
+                break
+            self.__entity_cell()
+            self.cycle_count = (i+1)
+            for hook in self.cycle_hooks:
+                hook(self)
+        return SimulationResult(self, self.original_growth_value)
+        #  Same cycle loop as simulation_controller
+        #  No grid, console clearing or saving, the result is returned instead
+        #  Starts from cycle_count so a restored simulation carries on where it stopped
+        #  cycle_hooks are called with the simulation after every cycle, one can end the run by setting stop_reason
+
+    def get_state(self):
+        version, internal_state, gauss_next = self.rng.getstate()
+        return {
+            "format": "evolution-simulator-checkpoint",
+            "version": 1,
+            "setup": SetupFile().to_dict(self.sim_setup),
+            "seed": self.seed,
+            "rng_state": [version, list(internal_state), gauss_next],
+            "growth_value": self.growth_value,
+            "original_growth_value": self.original_growth_value,
+            "mutation_value": self.mutation_value,
+            "mutation_count": self.mutation_count,
+            "survival_chance": self.survival_chance,
+            "cycle_count": self.cycle_count,
+            "negative_value": self.__negative_value,
+            "stop_reason": self.stop_reason,
+            "genomes": self.genomes.to_dict() if self.genomes is not None else None,
+            "nutrient_field": self.nutrient_field.to_dict() if self.nutrient_field is not None else None,
+            "world": self.sim_setup.world.to_dict() if self.sim_setup.world is not None else None,
+        }
+        #  The setup lists hold the live cells and remaining nutrients in their current order
+        #  Order matters because cells are picked by position, so it is kept as is
+
+    def set_state(self, state):
+        version, internal_state, gauss_next = state["rng_state"]
+        self.rng.setstate((version, tuple(internal_state), gauss_next))
+        self.growth_value = state["growth_value"]
+        self.original_growth_value = state["original_growth_value"]
+        self.mutation_value = state["mutation_value"]
+        self.mutation_count = state["mutation_count"]
+        self.survival_chance = state["survival_chance"]
+        self.cycle_count = state["cycle_count"]
+        self.__negative_value = state["negative_value"]
+        self.stop_reason = state.get("stop_reason")
+        if state.get("genomes") is not None:
+            self.genomes = CellGenomes(0, 0.0)
+            self.genomes.load(state["genomes"])
+        if state.get("nutrient_field") is not None:
+            data = state["nutrient_field"]
+            options = {name: data[name] for name in ("capacity", "diffusion", "regrowth", "consumption", "every")}
+            self.nutrient_field = NutrientField(self.sim_setup.rows, self.sim_setup.cols, obstacles = [tuple(square) for square in data["blocked"]], **options)
+            self.nutrient_field.load(data)
+
+    def is_extinct(self):
+        return self.__negative_value
+
+    def population(self):
+        return self.index.cell_count()
+
+    def can_grow(self):
+        free_neighbours = self.neighbours.free_neighbours
+        return any(free_neighbours(cell, self.index) for cell in reversed(self.index.cells))
+        #  Newest cells are checked first, they are the likeliest to have room
+
+    def nutrients_remaining(self):
+        return self.index.nutrient_count()
+
+    def __status(self, cycle):
+        return [
+            f"Current cycle count: {cycle}",
+            f"Current mutation count: {self.mutation_count}",
+            f"Current Growth Value: {round(self.growth_value, 4)}",
+            self.__message,
+        ]
+
+    def __output(self, message):
+        if self.headless:
+            return
+        if self.renderer is not None:
+            self.__message = message
+        else:
+            print(message)
+        #  While the renderer owns the screen messages are shown in its status lines
+
+    def __pause(self, seconds):
+        if not self.headless:
+            time.sleep(seconds)
+        #  Pauses only exist so users can read the messages
+
     def __entity_cell(self):
-        if self.start:
-            self.working_cell = random.choice(self.start) 
+        if self.nutrient_field is not None:
+            self.nutrient_field.tick()
+        if self.start and self.genomes is not None:
+            self.__working_id = self.index.random_cell_id(self.rng)
+            self.working_cell = self.start[self.__working_id]
+            self.growth_value = self.genomes.growth[self.__working_id]
+            self.__selected_cell.append(self.working_cell)
+            #  With per cell growth the working value is the chosen cell's own until the cycle ends
+        elif self.start:
+            self.working_cell = self.index.random_cell(self.rng)
             self.__selected_cell.append(self.working_cell)
         else: #  Ideally never called
-            print("No cells available in the start list")
-            self.simulation_controller()
+            self.__output("No cells available in the start list")
+            self.__negative_value = True
+            return
         self.__change_cell()
 
     def __change_cell(self):
-        xc = self.__selected_cell[0][0]  # xc current x point
-        yc = self.__selected_cell[0][1]  # yc current y point
-        xn = random.randint(-1, 1) + xc  # xn new x point
-        yn = random.randint(-1, 1) + yc  # yn new y point
-        if xn <= 0:
-            xn = xn + 1
-        elif xn >= self.rows:
-            xn = xn - 1
-        if yn <= 0:
-            yn = yn + 1
-        elif yn >= self.rows:
-            yn = yn - 1
+        free = self.neighbours.free_neighbours(self.__selected_cell[0], self.index)
+        if free:
+            xn, yn = free[self.rng.randrange(len(free))]  # xn, yn new point
+        else:
+            xn, yn = self.__selected_cell[0]
+        #  Only empty and nutrient squares on the grid are picked, each as likely as the others
+        #  A cell with nowhere to go stays put, which costs growth like bumping into a cell always has
         self.__surrounding_cell.append((xn, yn))
         self.__compare_values(xn, yn)
         return xn, yn
 
     def __compare_values(self, xn, yn):
-        if self.__surrounding_cell [0] in self.start:
+        if self.index.is_cell(self.__surrounding_cell [0]):
             self.growth_value = self.growth_value - 0.01
-        elif self.__surrounding_cell [0] in self.nutrients:
+        elif self.index.is_nutrient(self.__surrounding_cell [0]):
             self.growth_value = self.growth_value + 0.05
-            self.start.append((xn, yn))
-            self.nutrients.remove((xn, yn))
-        elif self.__surrounding_cell [0] in self.obstacles:
+            self.index.add_cell((xn, yn))
+            self.index.consume_nutrient((xn, yn))
+            if self.genomes is not None:
+                self.genomes.add_daughter(self.__working_id, self.growth_value)
+            if self.nutrient_field is not None:
+                self.nutrient_field.consume(xn, yn)
+        elif self.index.is_obstacle(self.__surrounding_cell [0]):
             self.growth_value = self.growth_value - 0.01
         else:
-            if random.random() < self.growth_value:
-                self.start.append((xn, yn))
+            chance = self.growth_value
+            if self.nutrient_field is not None:
+                chance = chance * self.nutrient_field.factor(xn, yn)
+            if self.rng.random() < chance:
+                self.index.add_cell((xn, yn))
+                if self.genomes is not None:
+                    self.genomes.add_daughter(self.__working_id, self.growth_value)
+                if self.nutrient_field is not None:
+                    self.nutrient_field.consume(xn, yn)
                 self.growth_value = self.growth_value - 0.01
             else: 
                 self.growth_value = self.growth_value - 0.01
-        print(f"Current Growth Value: {self.growth_value}")
+        self.__output(f"Current Growth Value: {self.growth_value}")
         self.__selected_cell.pop(-1)
         self.__surrounding_cell.pop(-1)
         self.__mutation_effect()
 
     def __mutation_effect(self):
-        if random.random() < self.mutation_value:
-            print("Mutation!")
+        if self.rng.random() < self.mutation_value:
+            self.__output("Mutation!")
             self.mutation_count = self.mutation_count + 1
-            change = round(random.uniform(-0.05, 0.05), 2)
+            change = round(self.rng.uniform(-0.05, 0.05), 2)
             self.growth_value = self.growth_value + change
-            time.sleep(1)
+            if self.genomes is not None:
+                self.genomes.mutations[self.__working_id] = self.genomes.mutations[self.__working_id] + 1
+            self.__pause(1)
+        if self.genomes is not None:
+            self.genomes.set_growth(self.__working_id, self.growth_value)
+            self.growth_value = self.genomes.mean_growth()
+            #  Survival is judged on the colony average, not the one cell
         self.__negative_growth_value()
     
     def __negative_growth_value(self):
         if self.growth_value <= 0:
-            print("Entity short of nutrients, survival is difficult!")
+            self.__output("Entity short of nutrients, survival is difficult!")
             self.survival_chance = self.survival_chance - 1
             if self.survival_chance == 0:
                 self.__negative_value = True
-            time.sleep(2)
-            nutrient_count = len(self.nutrients)
-            if nutrient_count > (0.01 * self.rows**2):
+            self.__pause(2)
+            nutrient_count = self.index.nutrient_count()
+            if nutrient_count > (0.01 * self.index.area()):
                 self.growth_value = self.growth_value + 0.025
+                if self.genomes is not None:
+                    self.genomes.shift_growth(0.025)
             else:
-                print("Enity unlikley to survive from here!")
-                time.sleep(2)
+                self.__output("Enity unlikley to survive from here!")
+                self.__pause(2)
                 self.__negative_value = True
 
 
@@ -577,6 +1783,7 @@ class SaveSimulation(EvolutionSimulator):
         self.mutation_count = mysimulation.mutation_count
         self.final_growth = mysimulation.growth_value
         self.cycle_count = mysimulation.cycle_count
+        self.seed = mysimulation.seed
 
     def save_simulation(self):
         self.filename = self.previous_setup.verify_filename()
@@ -589,10 +1796,2722 @@ class SaveSimulation(EvolutionSimulator):
             file.write(str(self.mutation_count) + "\n")
             file.write(str(self.final_growth) + "\n")
             file.write(str(self.cycle_count) + "\n")
+            file.write(str(self.seed) + "\n")
         print("Saving Complete")
         #  print(f"Variables have been written to {self.the_file}")
 
 
+class SimulationResult:
+    def __init__(self, mysimulation, original_growth_value):
+        self.cells = list(mysimulation.start)
+        self.nutrient_count = len(mysimulation.nutrients)
+        self.obstacle_count = len(mysimulation.obstacles)
+        if isinstance(mysimulation.nutrients, WorldView):
+            self.nutrients = None
+            self.obstacles = None
+        else:
+            self.nutrients = list(mysimulation.nutrients)
+            self.obstacles = list(mysimulation.obstacles)
+        self.mutation_count = mysimulation.mutation_count
+        self.original_growth_value = original_growth_value
+        self.growth_value = mysimulation.growth_value
+        self.cycle_count = mysimulation.cycle_count
+        self.survival_chance = mysimulation.survival_chance
+        self.extinct = mysimulation.is_extinct()
+        self.seed = mysimulation.seed
+        genomes = getattr(mysimulation, "genomes", None)
+        self.genomes = genomes.summary() if genomes is not None else None
+        self.colonies = mysimulation.colony_summary() if hasattr(mysimulation, "colony_summary") else None
+        self.stop_reason = getattr(mysimulation, "stop_reason", None) or ("extinct" if self.extinct else "completed")
+
+    def to_dict(self):
+        return {
+            "cells": self.cells,
+            "nutrients": self.nutrients,
+            "obstacles": self.obstacles,
+            "nutrient_count": self.nutrient_count,
+            "obstacle_count": self.obstacle_count,
+            "mutation_count": self.mutation_count,
+            "original_growth_value": self.original_growth_value,
+            "growth_value": self.growth_value,
+            "cycle_count": self.cycle_count,
+            "survival_chance": self.survival_chance,
+            "extinct": self.extinct,
+            "seed": self.seed,
+            "genomes": self.genomes,
+            "colonies": self.colonies,
+            "stop_reason": self.stop_reason,
+        }
+        #  Plain values so results can be written as JSON
+        #  Chunked world runs give nutrients and obstacles as counts only, listing them would walk the whole world
+        #  stop_reason is "completed", "extinct" or the name of the stop condition that ended the run
+
+
+class Colony:
+    def __init__(self, colony_id, name, growth_value, mutation_value):
+        self.colony_id = colony_id
+        self.name = name
+        self.growth_value = growth_value
+        self.original_growth_value = growth_value
+        self.mutation_value = mutation_value
+        self.mutation_count = 0
+        self.survival_chance = 3
+        self.extinct = False
+        self.takeovers = 0
+        self.cells_lost = 0
+
+    def to_dict(self, cells):
+        return {
+            "name": self.name,
+            "cells": cells,
+            "original_growth_value": self.original_growth_value,
+            "growth_value": self.growth_value,
+            "mutation_value": self.mutation_value,
+            "mutation_count": self.mutation_count,
+            "survival_chance": self.survival_chance,
+            "extinct": self.extinct,
+            "takeovers": self.takeovers,
+            "cells_lost": self.cells_lost,
+        }
+
+
+class MultiColonySimulation:
+    def __init__(self, sim_setup, seed = None):
+        self.seed = new_seed() if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.sim_setup = sim_setup
+        self.rows = sim_setup.rows
+        self.neighbours = sim_setup.neighbour_table()
+        self.cycles = sim_setup.cycles
+        self.colonies = []
+        colony_starts = []
+        for colony_id, (name, colony_setup) in enumerate(sim_setup.colony_setups()):
+            myvalue_calculator = ValueCalculator(colony_setup, headless = True, seed = derive_seed(self.seed, colony_id))
+            growth_value = myvalue_calculator.calc_growth_value()
+            mutation_value = myvalue_calculator.calc_mutation_value()
+            self.colonies.append(Colony(colony_id, name, growth_value, mutation_value))
+            colony_starts.append(colony_setup.start)
+        self.index = ColonyIndex(sim_setup, colony_starts)
+        self.nutrients = self.index.nutrients
+        self.obstacles = self.index.obstacles
+        self.cycle_count = 0
+        self.cycle_hooks = []
+        self.stop_reason = None
+        self.__living = [colony for colony in self.colonies if self.index.cell_count(colony.colony_id)]
+        #  Each colony's growth and mutation values come from its own settings, as for a single colony run
+        #  Only living colonies are stepped, extinct ones cost nothing
+
+    def run_headless(self):
+        for i in range(self.cycle_count, self.cycles):
+            if not self.__living or self.stop_reason is not None:
+                break
+            self.step()
+            self.cycle_count = (i+1)
+            for hook in self.cycle_hooks:
+                hook(self)
+        return SimulationResult(self, sum(colony.original_growth_value for colony in self.colonies) / len(self.colonies))
+
+    def step(self):
+        self.rng.shuffle(self.__living)
+        for colony in self.__living:
+            if not colony.extinct:
+                self.__colony_cell(colony)
+        if any(colony.extinct for colony in self.__living):
+            self.__living = [colony for colony in self.__living if not colony.extinct]
+        #  Every living colony moves one cell a cycle, in a new random order each cycle so none always goes first
+
+    def __colony_cell(self, colony):
+        cell = self.index.random_cell(colony.colony_id, self.rng)
+        owner_of = self.index.owner_of
+        is_obstacle = self.index.is_obstacle
+        targets = [square for square in self.neighbours.neighbours(cell)
+                   if owner_of(square) != colony.colony_id and not is_obstacle(square)]
+        target = targets[self.rng.randrange(len(targets))] if targets else cell
+        #  Rival cells count as places to go, taking them over is how colonies compete
+        owner = self.index.owner_of(target)
+        if owner == colony.colony_id:
+            colony.growth_value = colony.growth_value - 0.01
+        elif owner is not None:
+            self.__compete(colony, self.colonies[owner], target)
+        elif self.index.is_nutrient(target):
+            colony.growth_value = colony.growth_value + 0.05
+            self.index.add_cell(target, colony.colony_id)
+            self.index.consume_nutrient(target)
+        elif self.index.is_obstacle(target):
+            colony.growth_value = colony.growth_value - 0.01
+        else:
+            if self.rng.random() < colony.growth_value:
+                self.index.add_cell(target, colony.colony_id)
+            colony.growth_value = colony.growth_value - 0.01
+        if self.rng.random() < colony.mutation_value:
+            colony.mutation_count = colony.mutation_count + 1
+            colony.growth_value = colony.growth_value + round(self.rng.uniform(-0.05, 0.05), 2)
+        self.__negative_growth_value(colony)
+        #  Same moves as Simulation, plus pushing into another colony's cell
+        #  Nutrients are shared, whichever colony reaches one first takes it
+
+    def __compete(self, colony, rival, target):
+        strength = max(colony.growth_value, 0)
+        rival_strength = 0 if rival.extinct else max(rival.growth_value, 0)
+        if strength + rival_strength > 0 and self.rng.random() * (strength + rival_strength) < strength:
+            self.index.take_cell(target, colony.colony_id)
+            colony.takeovers = colony.takeovers + 1
+            rival.cells_lost = rival.cells_lost + 1
+            if not self.index.cell_count(rival.colony_id):
+                rival.extinct = True
+        colony.growth_value = colony.growth_value - 0.01
+        #  The attacker wins the square with probability strength / (strength + rival strength)
+        #  Either way it costs the attacker the same as any other growth attempt
+
+    def __negative_growth_value(self, colony):
+        if colony.growth_value <= 0:
+            colony.survival_chance = colony.survival_chance - 1
+            if colony.survival_chance == 0:
+                colony.extinct = True
+            if self.index.nutrient_count() > (0.01 * self.index.area()):
+                colony.growth_value = colony.growth_value + 0.025
+            else:
+                colony.extinct = True
+
+    @property
+    def start(self):
+        return [coordinate for cells in self.index.cells for coordinate in cells]
+
+    @property
+    def growth_value(self):
+        colonies = [colony for colony in self.colonies if not colony.extinct] or self.colonies
+        return sum(colony.growth_value for colony in colonies) / len(colonies)
+        #  Mean over the living colonies, used by telemetry and the combined result
+
+    @property
+    def mutation_count(self):
+        return sum(colony.mutation_count for colony in self.colonies)
+
+    @property
+    def survival_chance(self):
+        return max(colony.survival_chance for colony in self.colonies)
+
+    def is_extinct(self):
+        return not self.__living
+
+    def population(self):
+        return self.index.cell_count()
+
+    def can_grow(self):
+        owner = self.index.owner
+        is_obstacle = self.index.is_obstacle
+        return any(square not in owner and not is_obstacle(square) for cell in owner for square in self.neighbours.neighbours(cell))
+        #  Rival cells can still be taken over, but only an empty square adds to the total population
+
+    def nutrients_remaining(self):
+        return self.index.nutrient_count()
+
+    def colony_summary(self):
+        return [colony.to_dict(self.index.cell_count(colony.colony_id)) for colony in self.colonies]
+
+
+class VectorisedSimulation:
+    def __init__(self, sim_setup, growth_value, mutation_value, per_cell_growth = False, seed = None, nutrient_field = None):
+        np = require_numpy("The vectorised engine")
+        self.np = np
+        self.seed = new_seed() if seed is None else seed
+        self.rng = np.random.default_rng(self.seed)
+        self.rows = sim_setup.rows
+        self.cols = sim_setup.cols
+        self.cycles = sim_setup.cycles
+        self.neighbours = sim_setup.neighbour_table()
+        self.cell_grid = self.__to_array(sim_setup.start)
+        self.nutrient_grid = self.__to_array(sim_setup.nutrients)
+        self.obstacle_grid = self.__to_array(sim_setup.obstacles)
+        self.nutrient_grid &= ~self.cell_grid
+        self.growth_value = growth_value
+        self.mutation_value = mutation_value
+        self.growth = None
+        if per_cell_growth:
+            self.growth = np.zeros((self.rows, self.cols))
+            self.growth[self.cell_grid] = growth_value
+        self.mutation_count = 0
+        self.survival_chance = 3
+        self.cycle_count = 0
+        self.cell_updates = 0
+        self.nutrient_field = nutrient_field
+        self.genomes = None
+        self.cycle_hooks = []
+        self.stop_reason = None
+        self.__negative_value = False
+        #  Same state as Simulation but held as boolean arrays
+        #  per_cell_growth gives every cell its own growth value, daughters copy their parent
+
+    def __to_array(self, coordinates):
+        grid = self.np.zeros((self.rows, self.cols), dtype = bool)
+        for row, col in coordinates:
+            grid[row, col] = True
+        return grid
+
+    def run_headless(self):
+        original = self.growth_value
+        for i in range(self.cycle_count, self.cycles):
+            if self.__negative_value or self.stop_reason is not None:
+                break
+            self.step()
+            self.cycle_count = (i+1)
+            for hook in self.cycle_hooks:
+                hook(self)
+        return SimulationResult(self, original)
+
+    def step(self):
+        np = self.np
+        rows, cols = self.np.nonzero(self.cell_grid)
+        count = rows.size
+        if count == 0:
+            self.__negative_value = True
+            return
+        xn, yn = self.neighbours.choose_free(np, self.rng, rows, cols, ~(self.cell_grid | self.obstacle_grid))
+        #  Same free neighbour choice as Simulation.__change_cell, for every cell at once
+        flat = xn * self.cols + yn
+        occupied = self.cell_grid.ravel()[flat]
+        nutrient = self.nutrient_grid.ravel()[flat] & ~occupied
+        empty = ~occupied & ~nutrient & ~self.obstacle_grid.ravel()[flat]
+        eaten = np.zeros(count, dtype = bool)
+        nutrient_moves = np.flatnonzero(nutrient)
+        first = np.unique(flat[nutrient_moves], return_index = True)[1]
+        eaten[nutrient_moves[first]] = True
+        #  Only the first cell to reach a nutrient eats it, the rest find a cell there
+        if self.growth is None:
+            parent_growth = self.growth_value
+        else:
+            parent_growth = self.growth[rows, cols]
+        chance = parent_growth
+        if self.nutrient_field is not None:
+            self.nutrient_field.step()
+            chance = parent_growth * self.nutrient_field.factor(xn, yn)
+        grown = empty & (self.rng.random(count) < chance)
+        change = np.where(eaten, 0.05, -0.01)
+        mutated = self.rng.random(count) < self.mutation_value
+        mutation_change = np.round(self.rng.uniform(-0.05, 0.05, count), 2)
+        change = change + np.where(mutated, mutation_change, 0.0)
+        #  The __compare_values and __mutation_effect rules applied to each cell
+        new_cells = eaten | grown
+        if self.growth is None:
+            self.growth_value = self.growth_value + change.sum()
+        else:
+            self.growth[rows, cols] += change
+            self.growth[xn[new_cells], yn[new_cells]] = self.growth[rows[new_cells], cols[new_cells]]
+        self.cell_grid[xn[new_cells], yn[new_cells]] = True
+        self.nutrient_grid[xn[eaten], yn[eaten]] = False
+        if self.nutrient_field is not None:
+            self.nutrient_field.consume(xn[new_cells], yn[new_cells])
+        if self.growth is not None:
+            self.growth_value = float(self.growth[self.cell_grid].mean())
+        self.mutation_count = self.mutation_count + int(mutated.sum())
+        self.cell_updates = self.cell_updates + count
+        self.__negative_growth_value()
+
+    def __negative_growth_value(self):
+        if self.growth_value <= 0:
+            self.survival_chance = self.survival_chance - 1
+            if self.survival_chance == 0:
+                self.__negative_value = True
+            if self.nutrient_grid.sum() > (0.01 * self.rows * self.cols):
+                self.growth_value = self.growth_value + 0.025
+                if self.growth is not None:
+                    self.growth[self.cell_grid] += 0.025
+            else:
+                self.__negative_value = True
+        #  Checked once per step rather than once per cell
+
+    def is_extinct(self):
+        return self.__negative_value
+
+    def population(self):
+        return int(self.cell_grid.sum())
+
+    def can_grow(self):
+        return self.neighbours.any_free(self.np, self.cell_grid, ~(self.cell_grid | self.obstacle_grid))
+
+    def nutrients_remaining(self):
+        return int(self.nutrient_grid.sum())
+
+    @property
+    def start(self):
+        return [(int(row), int(col)) for row, col in zip(*self.np.nonzero(self.cell_grid))]
+
+    @property
+    def nutrients(self):
+        return [(int(row), int(col)) for row, col in zip(*self.np.nonzero(self.nutrient_grid))]
+
+    @property
+    def obstacles(self):
+        return [(int(row), int(col)) for row, col in zip(*self.np.nonzero(self.obstacle_grid))]
+
+
+def require_numpy(feature):
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError(f"{feature} needs NumPy. Install it with: pip install numpy") from None
+    return numpy
+    #  NumPy is only imported by the modes that use it
+
+
+def require_pyarrow(feature):
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(f"{feature} needs pyarrow. Install it with: pip install pyarrow") from None
+    return pyarrow, pyarrow.parquet
+
+
+class Checkpointer:
+    def __init__(self, path, every_cycles = None, every_seconds = None):
+        if every_cycles is None and every_seconds is None:
+            every_cycles = 1000
+        self.path = path
+        self.every_cycles = every_cycles
+        self.every_seconds = every_seconds
+        self.writes = 0
+        self.seconds = 0.0
+        self.last_bytes = 0
+        self.interrupted = False
+        self.__last_cycle = None
+        self.__last_time = time.perf_counter()
+        #  Checkpoints are taken every so many cycles, every so many seconds, or both
+
+    def interrupt(self, signum, frame):
+        if self.interrupted:
+            raise KeyboardInterrupt
+        self.interrupted = True
+        #  SIGINT handler, the checkpoint is written by the next call at the end of a cycle
+        #  A second Ctrl-C stops at once and leaves the last checkpoint as it was
+
+    def __call__(self, mysimulation):
+        if self.interrupted:
+            self.save(mysimulation)
+            mysimulation.stop_reason = "interrupted"
+            return
+        #  Saved before stop_reason is set, so the resumed run carries on instead of stopping again
+        if self.__last_cycle is None:
+            self.__last_cycle = mysimulation.cycle_count - 1
+        due = False
+        if self.every_cycles and mysimulation.cycle_count - self.__last_cycle >= self.every_cycles:
+            due = True
+        if self.every_seconds and time.perf_counter() - self.__last_time >= self.every_seconds:
+            due = True
+        if due:
+            self.save(mysimulation)
+
+    def save(self, mysimulation):
+        import tempfile
+        began = time.perf_counter()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        handle, temporary = tempfile.mkstemp(prefix = ".checkpoint-", dir = directory)
+        try:
+            with os.fdopen(handle, "w") as file:
+                json.dump(mysimulation.get_state(), file, separators = (",", ":"))
+                file.flush()
+                os.fsync(file.fileno())
+                self.last_bytes = file.tell()
+            os.replace(temporary, self.path)
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.__last_cycle = mysimulation.cycle_count
+        self.__last_time = time.perf_counter()
+        self.writes = self.writes + 1
+        self.seconds = self.seconds + (self.__last_time - began)
+        #  Written to a temporary file first and renamed over the old one
+        #  A crash while writing leaves the previous checkpoint untouched
+
+    def summary(self):
+        return {
+            "checkpoints": self.writes,
+            "total_seconds": round(self.seconds, 6),
+            "mean_ms": round(1000 * self.seconds / self.writes, 3) if self.writes else 0,
+            "last_bytes": self.last_bytes,
+        }
+
+
+class TelemetryRecorder:
+    FIELDS = ["cycle", "population", "nutrients_remaining", "growth_value", "mutation_events", "survival_chance"]
+
+    def __init__(self, path, file_format = None, batch_size = 1000, max_pending = 8, every = 1):
+        import queue
+        import threading
+        self.path = path
+        self.file_format = file_format or os.path.splitext(path)[1].lstrip(".").lower()
+        if self.file_format not in ("csv", "jsonl", "parquet"):
+            raise ValueError(f"Unknown telemetry format '{self.file_format}', use csv, jsonl or parquet.")
+        if self.file_format == "parquet":
+            require_pyarrow("Parquet telemetry")
+        self.batch_size = batch_size
+        self.every = every
+        self.rows_written = 0
+        self.__batch = []
+        self.__last_mutations = 0
+        self.__pending = queue.Queue(maxsize = max_pending)
+        self.__error = None
+        self.__writer = threading.Thread(target = self.__write_batches, daemon = True)
+        self.__writer.start()
+        #  Rows are collected in batches and written by a background thread
+        #  At most max_pending batches wait in memory, the loop only waits if the disk falls that far behind
+
+    def __call__(self, mysimulation):
+        mutation_count = mysimulation.mutation_count
+        if mysimulation.cycle_count % self.every:
+            return
+        self.__batch.append((
+            mysimulation.cycle_count,
+            mysimulation.population(),
+            mysimulation.nutrients_remaining(),
+            mysimulation.growth_value,
+            mutation_count - self.__last_mutations,
+            mysimulation.survival_chance,
+        ))
+        self.__last_mutations = mutation_count
+        if len(self.__batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.__error is not None:
+            raise self.__error
+        if self.__batch:
+            self.__pending.put(self.__batch)
+            self.__batch = []
+
+    def close(self):
+        self.flush()
+        self.__pending.put(None)
+        self.__writer.join()
+        if self.__error is not None:
+            raise self.__error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __write_batches(self):
+        import csv
+        try:
+            if self.file_format == "parquet":
+                self.__write_parquet()
+                return
+            with open(self.path, "w", newline = "") as file:
+                if self.file_format == "csv":
+                    writer = csv.writer(file)
+                    writer.writerow(self.FIELDS)
+                while True:
+                    batch = self.__pending.get()
+                    if batch is None:
+                        return
+                    if self.file_format == "csv":
+                        writer.writerows(batch)
+                    else:
+                        file.write("".join(json.dumps(dict(zip(self.FIELDS, row))) + "\n" for row in batch))
+                    file.flush()
+                    self.rows_written = self.rows_written + len(batch)
+        except Exception as e:
+            self.__error = e
+            self.__drain()
+
+    def __write_parquet(self):
+        pyarrow, parquet = require_pyarrow("Parquet telemetry")
+        schema = pyarrow.schema([("cycle", pyarrow.int64()), ("population", pyarrow.int64()),
+                                 ("nutrients_remaining", pyarrow.int64()), ("growth_value", pyarrow.float64()),
+                                 ("mutation_events", pyarrow.int64()), ("survival_chance", pyarrow.int64())])
+        with parquet.ParquetWriter(self.path, schema) as writer:
+            while True:
+                batch = self.__pending.get()
+                if batch is None:
+                    return
+                columns = list(zip(*batch))
+                writer.write_table(pyarrow.table({name: list(column) for name, column in zip(self.FIELDS, columns)}, schema = schema))
+                self.rows_written = self.rows_written + len(batch)
+        #  Each batch becomes one row group
+
+    def __drain(self):
+        while self.__pending.get() is not None:
+            pass
+        #  Keeps the simulation from blocking on a full queue after a write error
+
+
+class HistoryRecorder:
+    MAGIC = b"EVOHIST1"
+    RECORD = struct.Struct("<BIdII")
+    ENTRY = struct.Struct("<QQd")
+    DELTA = 0
+    KEYFRAME = 1
+    BASE = 2
+
+    def __init__(self, path, mysimulation, keyframe_every = 100):
+        if isinstance(mysimulation, MultiColonySimulation):
+            raise ValueError("History recording does not support multi-colony runs yet.")
+        if isinstance(mysimulation.nutrients, WorldView):
+            raise ValueError("History recording does not support chunked worlds, the base frame would hold the whole world.")
+        self.path = path
+        self.keyframe_every = keyframe_every
+        self.cycles_written = 0
+        self.__log = open(path, "wb")
+        self.__index = open(path + ".idx", "wb")
+        self.__offset = 0
+        self.__vectorised = hasattr(mysimulation, "cell_grid")
+        if self.__vectorised:
+            self.__cell_grid = mysimulation.cell_grid.copy()
+            self.__nutrient_grid = mysimulation.nutrient_grid.copy()
+        else:
+            self.__cell_count = mysimulation.index.cell_count()
+            self.__nutrient_count = mysimulation.index.nutrient_count()
+        self.__cells = bytearray(self.__pairs(mysimulation.start))
+        self.__consumed = bytearray()
+        nutrients = list(mysimulation.nutrients)
+        meta = json.dumps({
+            "rows": mysimulation.rows,
+            "cols": mysimulation.sim_setup.cols if hasattr(mysimulation, "sim_setup") else mysimulation.cols,
+            "first_cycle": mysimulation.cycle_count,
+            "keyframe_every": keyframe_every,
+            "seed": mysimulation.seed,
+            "obstacles": [list(coordinate) for coordinate in mysimulation.obstacles],
+        }).encode()
+        self.__write(self.MAGIC + struct.pack("<I", len(meta)) + meta)
+        self.__write(self.RECORD.pack(self.BASE, mysimulation.cycle_count, mysimulation.growth_value, len(nutrients), 0)
+                     + self.__pairs(nutrients))
+        self.__record(mysimulation, b"", 0, b"", 0)
+        #  The log holds the starting nutrients, then one delta record per cycle and a keyframe every keyframe_every cycles
+        #  Keyframes hold every cell and the nutrients consumed so far, so their size follows the colony, not the grid
+        #  The .idx file has a fixed size entry per cycle (delta offset, keyframe offset, growth value),
+        #  so a reader can find any cycle without scanning the log
+
+    def __call__(self, mysimulation):
+        if self.__vectorised:
+            np = mysimulation.np
+            added = np.argwhere(mysimulation.cell_grid & ~self.__cell_grid).astype(np.int32)
+            consumed = np.argwhere(self.__nutrient_grid & ~mysimulation.nutrient_grid).astype(np.int32)
+            self.__cell_grid |= mysimulation.cell_grid
+            self.__nutrient_grid &= mysimulation.nutrient_grid
+            self.__record(mysimulation, added.tobytes(), len(added), consumed.tobytes(), len(consumed))
+            return
+        cells = mysimulation.index.cells
+        added = cells[self.__cell_count:]
+        self.__cell_count = len(cells)
+        nutrient_count = mysimulation.index.nutrient_count()
+        consumed = added if nutrient_count < self.__nutrient_count else []
+        self.__nutrient_count = nutrient_count
+        self.__record(mysimulation, self.__pairs(added), len(added), self.__pairs(consumed), len(consumed))
+        #  Cells are only ever appended, so the new ones are the end of the cell list
+        #  At most one cell grows a cycle and a nutrient is only consumed by a cell growing onto it,
+        #  so if the nutrient count fell the new cell is where the nutrient was
+
+    def __record(self, mysimulation, added, added_count, consumed, consumed_count):
+        cycle = mysimulation.cycle_count
+        delta_offset = self.__offset
+        self.__write(self.RECORD.pack(self.DELTA, cycle, mysimulation.growth_value, added_count, consumed_count) + added + consumed)
+        self.__cells += added
+        self.__consumed += consumed
+        keyframe_offset = 0
+        if self.cycles_written % self.keyframe_every == 0:
+            keyframe_offset = self.__offset
+            self.__write(self.RECORD.pack(self.KEYFRAME, cycle, mysimulation.growth_value, len(self.__cells) // 8, len(self.__consumed) // 8)
+                         + self.__cells + self.__consumed)
+        self.__index.write(self.ENTRY.pack(delta_offset, keyframe_offset, mysimulation.growth_value))
+        self.cycles_written = self.cycles_written + 1
+
+    def __pairs(self, coordinates):
+        return array("i", [value for coordinate in coordinates for value in coordinate]).tobytes()
+
+    def __write(self, data):
+        self.__log.write(data)
+        self.__offset = self.__offset + len(data)
+
+    def close(self):
+        if not self.__log.closed:
+            self.__log.close()
+            self.__index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class HistoryReplay:
+    def __init__(self, path):
+        import mmap
+        self.path = path
+        with open(path, "rb") as file:
+            self.__log = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        with open(path + ".idx", "rb") as file:
+            self.__index = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+        if self.__log[:8] != HistoryRecorder.MAGIC:
+            raise SetupFormatError(f"'{path}' is not a run history file")
+        length = struct.unpack_from("<I", self.__log, 8)[0]
+        meta = json.loads(self.__log[12:12 + length])
+        self.rows = meta["rows"]
+        self.cols = meta["cols"]
+        self.first_cycle = meta["first_cycle"]
+        self.keyframe_every = meta["keyframe_every"]
+        self.seed = meta["seed"]
+        self.obstacles = [tuple(coordinate) for coordinate in meta["obstacles"]]
+        self.base_nutrients = set(self.__read(12 + length)[1])
+        entries = len(self.__index) // HistoryRecorder.ENTRY.size
+        while entries and not self.__complete(entries - 1):
+            entries = entries - 1
+        if not entries:
+            raise SetupFormatError(f"'{path}' has no complete cycles")
+        self.entries = entries
+        self.cycle = None
+        self.cells = set()
+        self.consumed = set()
+        self.growth_value = None
+        self.seek(self.first_cycle)
+        #  Both files are memory mapped, only the records that are read are paged in
+        #  Entries whose record did not reach the log (a run that was killed) are ignored
+        #  Nutrients are kept as the starting set plus the squares consumed by the current cycle
+
+    @property
+    def nutrients(self):
+        return self.base_nutrients - self.consumed
+
+    def is_nutrient(self, coordinate):
+        return coordinate in self.base_nutrients and coordinate not in self.consumed
+
+    def __len__(self):
+        return self.entries
+
+    def last_cycle(self):
+        return self.first_cycle + self.entries - 1
+
+    def __entry(self, position):
+        return HistoryRecorder.ENTRY.unpack_from(self.__index, position * HistoryRecorder.ENTRY.size)
+
+    def __complete(self, position):
+        offset = max(self.__entry(position)[:2])
+        if offset + HistoryRecorder.RECORD.size > len(self.__log):
+            return False
+        first, second = HistoryRecorder.RECORD.unpack_from(self.__log, offset)[3:]
+        return offset + HistoryRecorder.RECORD.size + 8 * (first + second) <= len(self.__log)
+
+    def __read(self, offset):
+        kind, cycle, growth_value, first, second = HistoryRecorder.RECORD.unpack_from(self.__log, offset)
+        offset = offset + HistoryRecorder.RECORD.size
+        first_values = array("i", self.__log[offset:offset + 8 * first])
+        second_values = array("i", self.__log[offset + 8 * first:offset + 8 * (first + second)])
+        return (growth_value, list(zip(first_values[0::2], first_values[1::2])),
+                list(zip(second_values[0::2], second_values[1::2])))
+
+    def growth_value_at(self, cycle):
+        return self.__entry(self.__position(cycle))[2]
+        #  Read straight from the index, for plotting without rebuilding any state
+
+    def __position(self, cycle):
+        position = cycle - self.first_cycle
+        if not 0 <= position < self.entries:
+            raise IndexError(f"cycle {cycle} is outside the recorded cycles {self.first_cycle} to {self.last_cycle()}")
+        return position
+
+    def seek(self, cycle):
+        position = self.__position(cycle)
+        if self.cycle is None or not 0 <= cycle - self.cycle <= self.keyframe_every:
+            keyframe = position - position % self.keyframe_every
+            self.growth_value, cells, consumed = self.__read(self.__entry(keyframe)[1])
+            self.cells = set(cells)
+            self.consumed = set(consumed)
+            self.cycle = self.first_cycle + keyframe
+        while self.cycle < cycle:
+            self.step_forward()
+        return self
+        #  Starts from the nearest keyframe at or before the cycle, so at most keyframe_every deltas are applied
+        #  Short jumps forward reuse the current state instead
+
+    def step_forward(self):
+        position = self.__position(self.cycle + 1)
+        self.growth_value, added, consumed = self.__read(self.__entry(position)[0])
+        self.cells.update(added)
+        self.consumed.update(consumed)
+        self.cycle = self.cycle + 1
+        return self
+
+    def step_back(self):
+        position = self.__position(self.cycle)
+        growth_value, added, consumed = self.__read(self.__entry(position)[0])
+        self.__position(self.cycle - 1)
+        self.cells.difference_update(added)
+        self.consumed.difference_update(consumed)
+        self.cycle = self.cycle - 1
+        self.growth_value = self.__entry(position - 1)[2]
+        return self
+        #  Each delta lists exactly what changed, so it can be undone without a keyframe
+
+    def frame(self, window = None):
+        top, left, rows, cols = window if window is not None else (0, 0, self.rows, self.cols)
+        if rows is None or cols is None:
+            raise ValueError("An unbounded world needs a window (row, col, rows, cols) to draw.")
+        frame = [bytearray(b"-" * cols) for i in range(rows)]
+        for symbol, coordinates in ((78, self.base_nutrients), (69, self.cells), (79, self.obstacles)):
+            for row, col in coordinates:
+                if 0 <= row - top < rows and 0 <= col - left < cols:
+                    frame[row - top][col - left] = symbol
+        return [row.decode() for row in frame]
+        #  Same symbols as Grid.frame
+
+    def play(self, start = None, end = None, step = 1, renderer = None, window = None):
+        start = self.first_cycle if start is None else start
+        end = self.last_cycle() if end is None else end
+        if renderer is None:
+            size = window[2:] if window is not None else (self.rows, self.cols)
+            renderer = TerminalRenderer(size[0], size[1])
+        self.seek(start)
+        while True:
+            renderer.draw(self.frame(window), [f"Cycle: {self.cycle}", f"Growth value: {round(self.growth_value, 4)}",
+                                               f"Cells: {len(self.cells)}"], force = True)
+            time.sleep(renderer.interval)
+            if (step > 0 and self.cycle + step > end) or (step < 0 and self.cycle + step < end):
+                break
+            if step == 1:
+                self.step_forward()
+            elif step == -1:
+                self.step_back()
+            else:
+                self.seek(self.cycle + step)
+        #  A negative step plays backwards, larger steps skip through the run
+
+    def close(self):
+        self.__log.close()
+        self.__index.close()
+
+
+class Instrumentation:
+    PHASES = {
+        "_Simulation__entity_cell": "cell selection",
+        "_Simulation__change_cell": "neighbour move",
+        "_Simulation__compare_values": "comparison",
+        "_Simulation__mutation_effect": "mutation",
+        "_Simulation__negative_growth_value": "survival check",
+        "step": "step",
+        "_VectorisedSimulation__negative_growth_value": "survival check",
+    }
+    SAVE_HOOKS = ("Checkpointer", "TelemetryRecorder", "HistoryRecorder")
+
+    def __init__(self, profile = False, trace_memory = False):
+        self.profile = profile
+        self.trace_memory = trace_memory
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {"blocked_moves": 0, "nutrient_captures": 0, "cells_grown": 0,
+                         "failed_growth": 0, "mutations": 0, "survival_losses": 0}
+        self.uncounted = set()
+        self.__children = []
+        self.__profiler = None
+        self.__memory = None
+        self.__wall = 0.0
+        self.__began = None
+        #  Nothing is timed until attach is called, so an uninstrumented run has no extra cost
+
+    def attach(self, mysimulation, renderer = None):
+        if not hasattr(mysimulation, "_Simulation__compare_values"):
+            self.uncounted.update(("blocked_moves", "failed_growth"))
+        for name, phase in self.PHASES.items():
+            method = getattr(mysimulation, name, None)
+            if method is not None:
+                setattr(mysimulation, name, self.__timed(phase, self.__counted(name, mysimulation, method)))
+        mysimulation.cycle_hooks[:] = [self.__timed("save" if type(hook).__name__ in self.SAVE_HOOKS else "hooks", hook)
+                                       for hook in mysimulation.cycle_hooks]
+        if renderer is not None:
+            renderer.draw = self.__timed("render", renderer.draw)
+        return mysimulation
+        #  The wrappers are stored on the instance, which Python checks before the class
+        #  Hooks added after attach are not timed
+
+    def __timed(self, phase, method):
+        self.seconds.setdefault(phase, 0.0)
+        self.calls.setdefault(phase, 0)
+
+        def timed(*args, **kwargs):
+            self.__children.append(0.0)
+            began = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - began
+                self.seconds[phase] = self.seconds[phase] + elapsed - self.__children.pop()
+                self.calls[phase] = self.calls[phase] + 1
+                if self.__children:
+                    self.__children[-1] = self.__children[-1] + elapsed
+        return timed
+        #  The simulation methods call each other in a chain, so time spent in the
+        #  next method is taken off the caller to give each phase its own time
+
+    def __counted(self, name, mysimulation, method):
+        counters = self.counters
+        if name == "_Simulation__compare_values":
+            def counted(xn, yn):
+                index = mysimulation.index
+                if index.is_cell((xn, yn)) or index.is_obstacle((xn, yn)):
+                    counters["blocked_moves"] = counters["blocked_moves"] + 1
+                    return method(xn, yn)
+                if index.is_nutrient((xn, yn)):
+                    counters["nutrient_captures"] = counters["nutrient_captures"] + 1
+                    return method(xn, yn)
+                population = index.cell_count()
+                try:
+                    return method(xn, yn)
+                finally:
+                    grown = "cells_grown" if index.cell_count() > population else "failed_growth"
+                    counters[grown] = counters[grown] + 1
+            return counted
+        if name == "step":
+            return self.__counted_step(mysimulation, method)
+        if name == "_Simulation__mutation_effect":
+            counter, attribute, sign = "mutations", "mutation_count", 1
+        elif name == "_Simulation__negative_growth_value":
+            counter, attribute, sign = "survival_losses", "survival_chance", -1
+        else:
+            return method
+
+        def counted(*args):
+            before = getattr(mysimulation, attribute)
+            try:
+                return method(*args)
+            finally:
+                counters[counter] = counters[counter] + sign * (getattr(mysimulation, attribute) - before)
+        return counted
+        #  Events are worked out from the state around each call, the simulation code is left alone
+
+    def __counted_step(self, mysimulation, method):
+        counters = self.counters
+
+        def survival():
+            if isinstance(mysimulation, MultiColonySimulation):
+                return sum(colony.survival_chance for colony in mysimulation.colonies)
+            return mysimulation.survival_chance
+
+        def counted():
+            population = mysimulation.population()
+            nutrients = mysimulation.nutrients_remaining()
+            mutations = mysimulation.mutation_count
+            survival_chance = survival()
+            try:
+                return method()
+            finally:
+                captures = nutrients - mysimulation.nutrients_remaining()
+                counters["nutrient_captures"] = counters["nutrient_captures"] + captures
+                counters["cells_grown"] = counters["cells_grown"] + mysimulation.population() - population - captures
+                counters["mutations"] = counters["mutations"] + mysimulation.mutation_count - mutations
+                counters["survival_losses"] = counters["survival_losses"] + survival_chance - survival()
+        return counted
+        #  The vectorised and multi-colony engines move every cell inside step, so their events are counted per step
+        #  A takeover moves a cell between colonies without changing the population, so it is not counted as growth
+        #  Blocked moves and failed growth cannot be told apart from the state, so those engines leave them out
+
+    def start(self):
+        import cProfile
+        import tracemalloc
+        self.__began = time.perf_counter()
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile:
+            self.__profiler = cProfile.Profile()
+            self.__profiler.enable()
+
+    def stop(self):
+        import tracemalloc
+        if self.__profiler is not None:
+            self.__profiler.disable()
+        if self.trace_memory and tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            self.__memory = {
+                "peak_bytes": tracemalloc.get_traced_memory()[1],
+                "top": [str(statistic) for statistic in snapshot.statistics("lineno")[:10]],
+            }
+            tracemalloc.stop()
+        if self.__began is not None:
+            self.__wall = self.__wall + (time.perf_counter() - self.__began)
+            self.__began = None
+
+    def run(self, mysimulation):
+        self.start()
+        try:
+            return mysimulation.run_headless()
+        finally:
+            self.stop()
+
+    def summary(self):
+        import pstats
+        timed = sum(self.seconds.values())
+        summary = {
+            "wall_seconds": round(self.__wall, 6),
+            "phases": {phase: {"seconds": round(seconds, 6), "calls": self.calls[phase],
+                               "share": round(seconds / timed, 4) if timed else 0}
+                       for phase, seconds in sorted(self.seconds.items(), key = lambda item: -item[1])},
+            "counters": {name: None if name in self.uncounted else value for name, value in self.counters.items()},
+        }
+        if self.__profiler is not None:
+            output = io.StringIO()
+            pstats.Stats(self.__profiler, stream = output).sort_stats("cumulative").print_stats(15)
+            summary["profile"] = output.getvalue()
+        if self.__memory is not None:
+            summary["memory"] = self.__memory
+        return summary
+
+
+class SaturationDetector:
+    def __init__(self, every = 50):
+        self.every = every
+
+    def __call__(self, mysimulation):
+        if mysimulation.cycle_count % self.every == 0 and not mysimulation.can_grow():
+            mysimulation.stop_reason = "saturated"
+        #  Stops once no cell has a free square next to it, nothing new can grow from there
+        #  Checked every few cycles because it can look at every cell
+
+
+class PlateauDetector:
+    def __init__(self, cycles = 500, tolerance = 0):
+        self.cycles = cycles
+        self.tolerance = tolerance
+        self.__population = None
+        self.__since = 0
+
+    def __call__(self, mysimulation):
+        population = mysimulation.population()
+        if self.__population is None or abs(population - self.__population) > self.tolerance:
+            self.__population = population
+            self.__since = mysimulation.cycle_count
+        elif mysimulation.cycle_count - self.__since >= self.cycles:
+            mysimulation.stop_reason = "plateau"
+        #  Stops when the population has stayed within tolerance cells of one value for the given number of cycles
+
+
+class LowGrowthDetector:
+    def __init__(self, threshold = 0.05, cycles = 200):
+        self.threshold = threshold
+        self.cycles = cycles
+        self.__below = 0
+
+    def __call__(self, mysimulation):
+        if mysimulation.growth_value < self.threshold:
+            self.__below = self.__below + 1
+            if self.__below >= self.cycles:
+                mysimulation.stop_reason = "low-growth"
+        else:
+            self.__below = 0
+        #  Stops when the growth value has been under the threshold for that many cycles in a row
+
+
+CONVERGENCE_DETECTORS = {"saturated": SaturationDetector, "plateau": PlateauDetector, "low-growth": LowGrowthDetector}
+
+
+def convergence_hooks(names, every = 50, plateau_cycles = 500, plateau_tolerance = 0, growth_threshold = 0.05, growth_cycles = 200):
+    hooks = []
+    for name in names:
+        if name not in CONVERGENCE_DETECTORS:
+            raise ValueError(f"Unknown stop condition '{name}', choose from {', '.join(CONVERGENCE_DETECTORS)}.")
+        if name == "saturated":
+            hooks.append(SaturationDetector(every))
+        elif name == "plateau":
+            hooks.append(PlateauDetector(plateau_cycles, plateau_tolerance))
+        else:
+            hooks.append(LowGrowthDetector(growth_threshold, growth_cycles))
+    return hooks
+    #  Detectors are cycle hooks, a run stops after the cycle in which one sets stop_reason
+
+
+def load_checkpoint(path, headless = True):
+    with open(path, "r") as file:
+        state = json.load(file)
+    if state.get("format") != "evolution-simulator-checkpoint":
+        raise SetupFormatError(f"'{path}' is not a checkpoint file")
+    return simulation_from_state(state, headless = headless)
+
+
+def simulation_from_state(state, headless = True):
+    if state.get("world") is not None:
+        mysimsetup = SimulationSetup()
+        for name, value in state["setup"].items():
+            setattr(mysimsetup, name, value)
+        mysimsetup.start = [tuple(coordinate) for coordinate in state["setup"]["start"]]
+        mysimsetup.nutrients = []
+        mysimsetup.obstacles = []
+        world = state["world"]
+        mysimsetup.world = ChunkedWorld(world["rows"], world["cols"], world["chunk_bits"]).load(world)
+    else:
+        mysimsetup = SetupFile().from_dict(state["setup"], SimulationSetup())
+    mysimulation = Simulation(PreviousSetup(), mysimsetup, state["growth_value"], state["mutation_value"],
+                              headless = headless, seed = state["seed"])
+    mysimulation.set_state(state)
+    return mysimulation
+    #  Continues exactly as the original run would have, including the random numbers
+
+
+def new_seed():
+    return random.SystemRandom().getrandbits(63)
+    #  Fresh seed for runs that were not given one, it is still recorded with the results
+
+
+def derive_seed(*parts):
+    digest = hashlib.sha256(repr(parts).encode()).digest()
+    return int.from_bytes(digest[:8], "big") >> 1
+    #  Hashing spreads related inputs (seed 0 and 1, run 5 and 6) into unrelated streams
+
+
+def spawn_seeds(seed, count):
+    return [derive_seed(seed, position) for position in range(count)]
+    #  Independent child seeds for workers, the same parent seed always gives the same children
+    #  Done with hashlib rather than NumPy so it works without NumPy installed
+
+
+def check_simulation_options(sim_setup, engine = "sequential", per_cell_growth = False, nutrient_field = None):
+    if sim_setup.world is not None and (engine != "sequential" or nutrient_field is not None):
+        raise ValueError("Chunked worlds only work with the sequential engine and without a nutrient field.")
+    if sim_setup.colonies:
+        if engine != "sequential" or per_cell_growth or nutrient_field is not None or sim_setup.world is not None:
+            raise ValueError("Multi-colony setups only work with the sequential engine and without per cell growth, "
+                             "a nutrient field or a chunked world.")
+    #  Kept apart from create_simulation so the command line can report bad combinations before anything runs
+
+
+def create_simulation(sim_setup, engine = "sequential", per_cell_growth = False, seed = None, nutrient_field = None):
+    mysimsetup = sim_setup.copy()
+    check_simulation_options(mysimsetup, engine = engine, per_cell_growth = per_cell_growth, nutrient_field = nutrient_field)
+    if mysimsetup.colonies:
+        return MultiColonySimulation(mysimsetup, seed = seed)
+    field = create_nutrient_field(mysimsetup, nutrient_field) if nutrient_field is not None else None
+    seed = new_seed() if seed is None else seed
+    myvalue_calculator = ValueCalculator(mysimsetup, headless = True, seed = seed)
+    growth_value = myvalue_calculator.calc_growth_value()
+    mutation_value = myvalue_calculator.calc_mutation_value()
+    if engine == "vectorised":
+        mysimulation = VectorisedSimulation(mysimsetup, growth_value, mutation_value, per_cell_growth = per_cell_growth, seed = seed,
+                                            nutrient_field = field)
+    elif engine == "sequential":
+        mysimulation = Simulation(PreviousSetup(), mysimsetup, growth_value, mutation_value, headless = True, seed = seed,
+                                  per_cell_growth = per_cell_growth, nutrient_field = field)
+    else:
+        raise ValueError(f"Unknown engine '{engine}'.")
+    return mysimulation
+    #  The setup passed in is left unchanged so it can be reused
+    #  The vectorised engine moves every cell each cycle instead of one
+    #  nutrient_field is a dict of NutrientField options, or {} for the defaults
+
+
+def run_headless(sim_setup, engine = "sequential", per_cell_growth = False, seed = None, cycle_hooks = ()):
+    mysimulation = create_simulation(sim_setup, engine = engine, per_cell_growth = per_cell_growth, seed = seed)
+    mysimulation.cycle_hooks.extend(cycle_hooks)
+    return mysimulation.run_headless()
+    #  Runs every cycle without prompts, sleeps, console clears or printing
+
+
+class ResultCache:
+    ENGINE_VERSION = 4
+
+    def __init__(self, path, max_bytes = 256 * 1024 * 1024, memory_entries = 1024, checkpoint_every = 1000):
+        import sqlite3
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.checkpoint_every = checkpoint_every
+        self.hits = {"memory": 0, "disk": 0, "checkpoint": 0, "miss": 0}
+        self.__memory = collections.OrderedDict()
+        self.__database = sqlite3.connect(path, timeout = 30)
+        self.__database.execute("PRAGMA journal_mode = WAL")
+        self.__database.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, prefix TEXT, cycle INTEGER, "
+                                "value BLOB NOT NULL, size INTEGER NOT NULL, used REAL NOT NULL)")
+        self.__database.execute("CREATE INDEX IF NOT EXISTS entries_prefix ON entries (prefix, cycle)")
+        self.__database.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used)")
+        self.__database.commit()
+        self.__bytes = self.__stored_bytes()
+        #  Results and prefix checkpoints share one table, results have no prefix
+        #  Values are zlib compressed JSON, evicted oldest use first once the file holds more than max_bytes
+        #  The most recent results are also kept decoded in memory, those hits never touch the disk
+        #  Bump ENGINE_VERSION whenever a change to the simulation rules changes results, old entries then stop matching
+        #  The byte total is read once and then kept up to date, so a put does not have to add up the whole table
+
+    def key(self, sim_setup, seed, engine = "sequential", per_cell_growth = False, nutrient_field = None, cycles = True):
+        data = SetupFile().to_dict(sim_setup)
+        if sim_setup.world is not None:
+            data["world"] = sim_setup.world.to_dict()
+        if not cycles:
+            del data["cycles"]
+        data.update({"seed": seed, "engine": engine, "per_cell_growth": per_cell_growth, "nutrient_field": nutrient_field,
+                     "engine_version": self.ENGINE_VERSION, "prefix": not cycles})
+        digest = hashlib.sha256()
+        for name in ("start", "nutrients", "obstacles"):
+            values = array("q", itertools.chain.from_iterable(data.pop(name)))
+            digest.update(len(values).to_bytes(8, "little"))
+            digest.update(values.tobytes())
+        digest.update(json.dumps(data, sort_keys = True, separators = (",", ":")).encode())
+        return digest.hexdigest()
+        #  Every setup field is hashed, coordinate lists keep their order because cells are picked by position
+        #  The coordinate lists are packed as integers rather than written as JSON, that is most of the time a hit takes
+        #  The prefix key leaves out the cycle count, a run's state at a cycle does not depend on how long it will go on
+
+    def get(self, key):
+        result = self.__memory.get(key)
+        if result is not None:
+            self.__memory.move_to_end(key)
+            self.hits["memory"] = self.hits["memory"] + 1
+            return result
+        row = self.__database.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.__database.execute("UPDATE entries SET used = ? WHERE key = ?", (time.time(), key))
+        self.__database.commit()
+        result = self.__decode(row[0])
+        self.__remember(key, result)
+        self.hits["disk"] = self.hits["disk"] + 1
+        return result
+        #  Results are shared with the memory tier, treat them as read only
+
+    def put(self, key, result, prefix = None, cycle = None):
+        value = self.__encode(result)
+        replaced = self.__database.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        self.__database.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                                (key, prefix, cycle, value, len(value), time.time()))
+        self.__bytes = self.__bytes + len(value) - (replaced[0] if replaced is not None else 0)
+        if self.__bytes > self.max_bytes:
+            self.__evict()
+        self.__database.commit()
+        if prefix is None:
+            self.__remember(key, result)
+
+    def checkpoint(self, prefix, cycles):
+        row = self.__database.execute("SELECT key, value FROM entries WHERE prefix = ? AND cycle <= ? ORDER BY cycle DESC LIMIT 1",
+                                      (prefix, cycles)).fetchone()
+        if row is None:
+            return None
+        self.__database.execute("UPDATE entries SET used = ? WHERE key = ?", (time.time(), row[0]))
+        self.__database.commit()
+        return self.__decode(row[1])
+        #  The latest saved state at or before the wanted cycle count
+
+    def run(self, sim_setup, seed, engine = "sequential", per_cell_growth = False, nutrient_field = None):
+        options = {"engine": engine, "per_cell_growth": per_cell_growth, "nutrient_field": nutrient_field}
+        key = self.key(sim_setup, seed, **options)
+        result = self.get(key)
+        if result is not None:
+            return result
+        prefix = self.key(sim_setup, seed, cycles = False, **options)
+        state = self.checkpoint(prefix, sim_setup.cycles) if engine == "sequential" and not sim_setup.colonies else None
+        if state is not None:
+            mysimulation = simulation_from_state(state)
+            mysimulation.cycles = sim_setup.cycles
+            self.hits["checkpoint"] = self.hits["checkpoint"] + 1
+        else:
+            mysimulation = create_simulation(sim_setup, seed = seed, **options)
+            self.hits["miss"] = self.hits["miss"] + 1
+        if self.checkpoint_every and isinstance(mysimulation, Simulation):
+            mysimulation.cycle_hooks.append(self.__checkpoint_hook(prefix))
+        result = json.loads(json.dumps(mysimulation.run_headless().to_dict()))
+        self.put(key, result)
+        return result
+        #  A miss starts from the longest cached prefix of the same run when there is one
+        #  Returned results are always the JSON form, so a fresh result looks the same as a cached one
+
+    def __checkpoint_hook(self, prefix):
+        def save(mysimulation):
+            if mysimulation.cycle_count % self.checkpoint_every == 0:
+                self.put(f"{prefix}:{mysimulation.cycle_count}", mysimulation.get_state(), prefix = prefix,
+                         cycle = mysimulation.cycle_count)
+        return save
+
+    def __remember(self, key, result):
+        self.__memory[key] = result
+        self.__memory.move_to_end(key)
+        while len(self.__memory) > self.memory_entries:
+            self.__memory.popitem(last = False)
+
+    def __stored_bytes(self):
+        return self.__database.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def __evict(self):
+        self.__bytes = self.__stored_bytes()
+        while self.__bytes > self.max_bytes:
+            oldest = self.__database.execute("SELECT key, size FROM entries ORDER BY used LIMIT 64").fetchall()
+            if not oldest:
+                break
+            for key, size in oldest:
+                self.__database.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.__memory.pop(key, None)
+                self.__bytes = self.__bytes - size
+                if self.__bytes <= self.max_bytes:
+                    break
+        #  Other processes can share the cache file, so the real total is read again before anything is removed
+        #  The oldest entries are fetched a few at a time through the used index rather than all at once
+
+    def __encode(self, value):
+        import zlib
+        return zlib.compress(json.dumps(value, separators = (",", ":")).encode())
+
+    def __decode(self, value):
+        import zlib
+        return json.loads(zlib.decompress(value))
+
+    def summary(self):
+        count, total = self.__database.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"entries": count, "bytes": total, "memory_entries": len(self.__memory), "hits": dict(self.hits)}
+
+    def close(self):
+        self.__database.close()
+
+
+open_caches = {}
+
+
+def cached_result(path, sim_setup, seed, engine):
+    if path not in open_caches:
+        open_caches[path] = ResultCache(path)
+    return open_caches[path].run(sim_setup, seed, engine = engine)
+    #  Worker processes keep one connection per cache file for all the runs they are given
+
+
+class MetricsCollector:
+    def __init__(self, every = 1):
+        self.every = every
+        self.rows = []
+        self.__last_mutations = 0
+
+    def __call__(self, mysimulation):
+        mutation_count = mysimulation.mutation_count
+        if mysimulation.cycle_count % self.every:
+            return
+        self.rows.append((
+            mysimulation.cycle_count,
+            mysimulation.population(),
+            mysimulation.nutrients_remaining(),
+            mysimulation.growth_value,
+            mutation_count - self.__last_mutations,
+            mysimulation.survival_chance,
+        ))
+        self.__last_mutations = mutation_count
+        #  The same rows as TelemetryRecorder, kept in memory for ResultsStore.add_runs
+
+
+class ResultsStore:
+    RUN_FIELDS = ["label", "seed", "engine", "final_population", "nutrients_remaining", "mutation_count",
+                  "original_growth_value", "growth_value", "cycle_count", "extinct", "stop_reason", "seconds"]
+    PARAMETER_FIELDS = ["rows", "cols", "genotype", "phenotype", "environment", "xray", "gamma", "particle", "cycles",
+                        "start_cells", "nutrients", "obstacles", "colonies", "neighbourhood", "wrap", "layout", "layout_seed"]
+    METRIC_FIELDS = TelemetryRecorder.FIELDS
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, recorded REAL NOT NULL, label TEXT, seed INTEGER,
+            engine TEXT, final_population INTEGER, nutrients_remaining INTEGER, mutation_count INTEGER,
+            original_growth_value REAL, growth_value REAL, cycle_count INTEGER, extinct INTEGER, stop_reason TEXT, seconds REAL);
+        CREATE TABLE IF NOT EXISTS parameters (run_id INTEGER PRIMARY KEY REFERENCES runs (run_id) ON DELETE CASCADE,
+            rows INTEGER, cols INTEGER, genotype INTEGER, phenotype INTEGER, environment INTEGER, xray REAL, gamma REAL,
+            particle REAL, cycles INTEGER, start_cells INTEGER, nutrients INTEGER, obstacles INTEGER, colonies INTEGER,
+            neighbourhood TEXT, wrap INTEGER, layout TEXT, layout_seed INTEGER);
+        CREATE TABLE IF NOT EXISTS metrics (run_id INTEGER NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+            cycle INTEGER NOT NULL, population INTEGER, nutrients_remaining INTEGER, growth_value REAL,
+            mutation_events INTEGER, survival_chance INTEGER, PRIMARY KEY (run_id, cycle)) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS runs_label ON runs (label);
+        CREATE INDEX IF NOT EXISTS parameters_modes ON parameters (genotype, phenotype, environment);
+        CREATE INDEX IF NOT EXISTS parameters_radiation ON parameters (xray, gamma, particle);
+        CREATE INDEX IF NOT EXISTS parameters_size ON parameters (rows, cols);
+        CREATE VIEW IF NOT EXISTS run_summary AS SELECT * FROM runs JOIN parameters USING (run_id);
+    """
+
+    def __init__(self, path, timeout = 60):
+        import sqlite3
+        self.path = path
+        self.__database = sqlite3.connect(path, timeout = timeout, isolation_level = None)
+        self.__database.execute("PRAGMA journal_mode = WAL")
+        self.__database.execute("PRAGMA synchronous = NORMAL")
+        self.__database.execute("PRAGMA foreign_keys = ON")
+        self.__database.executescript(self.SCHEMA)
+        if "stop_reason" not in [row[1] for row in self.__database.execute("PRAGMA table_info(runs)")]:
+            self.__database.execute("ALTER TABLE runs ADD COLUMN stop_reason TEXT")
+        self.columns = ["run_id", "recorded"] + self.RUN_FIELDS + self.PARAMETER_FIELDS
+        #  One row per run in runs and parameters, joined by the run_summary view, plus optional per-cycle rows in metrics
+        #  WAL lets readers carry on while a writer inserts, writers from other processes wait up to timeout seconds
+        #  Stores made before stop_reason existed get the column added, their old runs read it as NULL
+
+    def add_runs(self, runs):
+        recorded = time.time()
+        run_ids = []
+        self.__database.execute("BEGIN IMMEDIATE")
+        try:
+            for run in runs:
+                cursor = self.__database.execute(f"INSERT INTO runs (recorded, {', '.join(self.RUN_FIELDS)}) "
+                                                 f"VALUES (?{', ?' * len(self.RUN_FIELDS)})",
+                                                 [recorded] + [run.get(name) for name in self.RUN_FIELDS])
+                run_id = cursor.lastrowid
+                self.__database.execute(f"INSERT INTO parameters (run_id, {', '.join(self.PARAMETER_FIELDS)}) "
+                                        f"VALUES (?{', ?' * len(self.PARAMETER_FIELDS)})",
+                                        [run_id] + [run.get(name) for name in self.PARAMETER_FIELDS])
+                if run.get("metrics"):
+                    self.__database.executemany(f"INSERT INTO metrics VALUES (?{', ?' * len(self.METRIC_FIELDS)})",
+                                                [(run_id,) + tuple(row) for row in run["metrics"]])
+                run_ids.append(run_id)
+            self.__database.execute("COMMIT")
+        except BaseException:
+            self.__database.execute("ROLLBACK")
+            raise
+        return run_ids
+        #  The whole batch is one transaction, so other processes never see half of it
+        #  BEGIN IMMEDIATE takes the write lock up front, parallel writers queue for it instead of failing part way
+
+    def add_run(self, sim_setup, result, **options):
+        return self.add_runs([result_record(sim_setup, result, **options)])[0]
+
+    def runs(self, where = None, columns = None):
+        columns = self.__check(columns or self.columns)
+        condition, values = self.__where(where)
+        cursor = self.__database.execute(f"SELECT {', '.join(columns)} FROM run_summary{condition} ORDER BY run_id", values)
+        for row in cursor:
+            yield dict(zip(columns, row))
+
+    def metrics(self, run_id):
+        cursor = self.__database.execute(f"SELECT {', '.join(self.METRIC_FIELDS)} FROM metrics WHERE run_id = ? ORDER BY cycle", (run_id,))
+        return [dict(zip(self.METRIC_FIELDS, row)) for row in cursor]
+
+    def aggregate(self, group_by = ("genotype", "environment"), metric = "final_population", where = None):
+        group_by = self.__check(list(group_by))
+        self.__check([metric])
+        condition, values = self.__where(where)
+        groups = ", ".join(group_by)
+        cursor = self.__database.execute(
+            f"SELECT {groups + ', ' if groups else ''}COUNT({metric}), AVG({metric}), MIN({metric}), MAX({metric}), "
+            f"AVG({metric} * {metric}) FROM run_summary{condition}"
+            + (f" GROUP BY {groups} ORDER BY {groups}" if groups else ""), values)
+        summary = []
+        for row in cursor:
+            count, mean, low, high, mean_square = row[len(group_by):]
+            entry = dict(zip(group_by, row))
+            entry.update({"runs": count, "mean": mean, "min": low, "max": high,
+                          "std": math.sqrt(max(0.0, mean_square - mean * mean)) if count else None})
+            summary.append(entry)
+        return summary
+        #  Grouping and averaging happen inside SQLite, only one row per group comes back
+        #  std is the population standard deviation
+
+    def export(self, path, where = None):
+        import csv
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in (".csv", ".jsonl"):
+            raise ValueError(f"Results can be exported as .csv or .jsonl, not '{extension}'.")
+        count = 0
+        with open(path, "w", newline = "") as file:
+            if extension == ".csv":
+                writer = csv.DictWriter(file, fieldnames = self.columns)
+                writer.writeheader()
+            for run in self.runs(where):
+                if extension == ".csv":
+                    writer.writerow(run)
+                else:
+                    file.write(json.dumps(run) + "\n")
+                count = count + 1
+        return count
+        #  Streams rows from the cursor, so exports of any size use little memory
+
+    def __check(self, columns):
+        unknown = [name for name in columns if name not in self.columns]
+        if unknown:
+            raise ValueError(f"Unknown result column {', '.join(repr(name) for name in unknown)}, choose from {', '.join(self.columns)}.")
+        return columns
+        #  Column names go into the SQL text, so only known names are allowed
+
+    def __where(self, where):
+        if not where:
+            return "", []
+        conditions = []
+        values = []
+        for name, value in where.items():
+            self.__check([name])
+            if isinstance(value, (list, tuple, set)):
+                conditions.append(f"{name} IN ({', '.join('?' * len(value))})")
+                values.extend(value)
+            else:
+                conditions.append(f"{name} = ?")
+                values.append(value)
+        return " WHERE " + " AND ".join(conditions), values
+        #  Each entry matches one value, or any of a list of values
+
+    def close(self):
+        self.__database.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def result_record(sim_setup, result, engine = "sequential", seconds = None, label = None, metrics = None, **extra):
+    if not isinstance(result, dict):
+        result = result.to_dict()
+    if sim_setup.world is not None:
+        nutrients = sim_setup.world.counts[ChunkedWorld.NUTRIENT]
+        obstacles = sim_setup.world.counts[ChunkedWorld.OBSTACLE]
+    else:
+        nutrients = len(sim_setup.nutrients)
+        obstacles = len(sim_setup.obstacles)
+    run = dict.fromkeys(ResultsStore.RUN_FIELDS + ResultsStore.PARAMETER_FIELDS)
+    run.update({name: getattr(sim_setup, name) for name in ("rows", "cols", "cycles") + SetupFile.MODES + SetupFile.RADIATION})
+    run.update({
+        "label": label,
+        "seed": result["seed"],
+        "engine": engine,
+        "final_population": len(result["cells"]),
+        "nutrients_remaining": result["nutrient_count"],
+        "mutation_count": result["mutation_count"],
+        "original_growth_value": result["original_growth_value"],
+        "growth_value": result["growth_value"],
+        "cycle_count": result["cycle_count"],
+        "extinct": result["extinct"],
+        "stop_reason": result.get("stop_reason"),
+        "seconds": seconds,
+        "start_cells": len(sim_setup.start),
+        "nutrients": nutrients,
+        "obstacles": obstacles,
+        "colonies": len(sim_setup.colonies) + 1,
+        "neighbourhood": getattr(sim_setup, "neighbourhood", "moore"),
+        "wrap": getattr(sim_setup, "wrap", False),
+        "metrics": metrics,
+    })
+    run.update(extra)
+    return run
+    #  Builds the flat mapping ResultsStore.add_runs takes, from the setup a run started with and its result
+    #  extra fills in anything the setup does not know, such as a sweep's layout
+
+
+class ParameterSweep:
+    LAYOUTS = {"none": (0, 0), "sparse": (0.05, 0.02), "dense": (0.2, 0.1)}
+    FIELDS = ["size", "genotype", "phenotype", "environment", "xray", "gamma", "particle", "layout", "seed"]
+    RESULT_FIELDS = ["run_seed", "final_population", "nutrients_remaining", "mutation_count", "original_growth_value",
+                     "growth_value", "cycle_count", "extinct", "stop_reason", "seconds"]
+    STORE_BATCH = 200
+
+    def __init__(self, sizes = (10,), genotypes = (5,), phenotypes = (5,), environments = (5,), xrays = (0.01,),
+                 gammas = (0.01,), particles = (0.01,), layouts = ("sparse",), seeds = (0,), cycles = 100,
+                 engine = "sequential", samples = None, sample_seed = 0, cache = None, store = None, metrics_every = 0,
+                 stop_when = (), stop_options = None):
+        self.axes = [list(sizes), list(genotypes), list(phenotypes), list(environments), list(xrays),
+                     list(gammas), list(particles), list(layouts), list(seeds)]
+        for layout in layouts:
+            if layout not in self.LAYOUTS:
+                raise ValueError(f"Unknown layout '{layout}', choose from {sorted(self.LAYOUTS)}.")
+        self.cycles = cycles
+        self.engine = engine
+        self.samples = samples
+        self.sample_seed = sample_seed
+        self.cache = cache
+        self.store = store
+        self.metrics_every = metrics_every
+        self.stop_when = list(stop_when)
+        self.stop_options = dict(stop_options or {})
+        if self.stop_when and cache is not None:
+            raise ValueError("Stop conditions cannot be used with a result cache, cached results are for full runs.")
+        convergence_hooks(self.stop_when, **self.stop_options)
+        #  Each axis is a list of values, every combination is one run
+        #  store is a ResultsStore path, metrics_every > 0 also stores every Nth cycle of each run there
+        #  stop_when names convergence detectors, stop_options are passed to convergence_hooks
+
+    def total(self):
+        total = 1
+        for axis in self.axes:
+            total = total * len(axis)
+        return total
+
+    def configurations(self):
+        if self.samples is None or self.samples >= self.total():
+            for values in itertools.product(*self.axes):
+                yield self.__configuration(values)
+            return
+        chosen = random.Random(self.sample_seed).sample(range(self.total()), self.samples)
+        for number in sorted(chosen):
+            values = []
+            for axis in reversed(self.axes):
+                number, position = divmod(number, len(axis))
+                values.append(axis[position])
+            yield self.__configuration(reversed(values))
+        #  Sampled runs are picked by position so the full product is never built
+
+    def __configuration(self, values):
+        configuration = dict(zip(self.FIELDS, values))
+        configuration["cycles"] = self.cycles
+        configuration["engine"] = self.engine
+        configuration["cache"] = self.cache
+        if self.store is not None:
+            configuration["record"] = True
+        configuration["metrics_every"] = self.metrics_every
+        configuration["stop_when"] = self.stop_when
+        configuration["stop_options"] = self.stop_options
+        return configuration
+
+    def run(self, output_path, workers = None, chunksize = None):
+        import multiprocessing
+        workers = workers or os.cpu_count() or 1
+        if chunksize is None:
+            chunksize = max(1, min(64, self.total() // (workers * 8)))
+        completed = 0
+        mystore = ResultsStore(self.store) if self.store is not None else None
+        records = []
+        try:
+            with SweepWriter(output_path, self.FIELDS + ["cycles", "engine"] + self.RESULT_FIELDS) as writer:
+                with multiprocessing.Pool(workers) as pool:
+                    for row in pool.imap_unordered(run_sweep_configuration, self.configurations(), chunksize):
+                        record = row.pop("record", None)
+                        writer.write(row)
+                        completed = completed + 1
+                        if record:
+                            records.append(record)
+                        if mystore is not None and len(records) >= self.STORE_BATCH:
+                            mystore.add_runs(records)
+                            records = []
+            if mystore is not None and records:
+                mystore.add_runs(records)
+        finally:
+            if mystore is not None:
+                mystore.close()
+        return completed
+        #  Rows are written as soon as each run finishes, in whatever order they finish
+        #  Chunks keep the pool busy without sending one run at a time
+        #  Stored runs go in STORE_BATCH at a time, one transaction each rather than one per run
+
+
+class SweepWriter:
+    TYPES = {"layout": "string", "engine": "string", "stop_reason": "string", "extinct": "bool", "xray": "float64",
+             "gamma": "float64", "particle": "float64", "original_growth_value": "float64", "growth_value": "float64",
+             "seconds": "float64"}
+    ROW_GROUP = 1000
+
+    def __init__(self, path, columns):
+        import csv
+        self.path = path
+        self.columns = columns
+        self.__rows = []
+        self.__parquet = None
+        if os.path.splitext(path)[1].lower() == ".parquet":
+            pyarrow, parquet = require_pyarrow("Parquet sweep output")
+            self.__schema = pyarrow.schema([(name, pyarrow.type_for_alias(self.TYPES.get(name, "int64"))) for name in columns])
+            self.__pyarrow = pyarrow
+            self.__parquet = parquet.ParquetWriter(path, self.__schema)
+        else:
+            self.__file = open(path, "w", newline = "")
+            self.__csv = csv.DictWriter(self.__file, fieldnames = columns, extrasaction = "ignore")
+            self.__csv.writeheader()
+        #  .parquet paths get a columnar file written ROW_GROUP rows at a time, anything else is CSV written row by row
+        #  Columns not listed in TYPES are integers
+
+    def write(self, row):
+        if self.__parquet is None:
+            self.__csv.writerow(row)
+            self.__file.flush()
+            return
+        self.__rows.append(row)
+        if len(self.__rows) >= self.ROW_GROUP:
+            self.flush()
+
+    def flush(self):
+        if self.__parquet is not None and self.__rows:
+            table = self.__pyarrow.table({name: [row[name] for row in self.__rows] for name in self.columns}, schema = self.__schema)
+            self.__parquet.write_table(table)
+            self.__rows = []
+
+    def close(self):
+        if self.__parquet is not None:
+            self.flush()
+            self.__parquet.close()
+        else:
+            self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def setup_from_parameters(size, genotype, phenotype, environment, xray, gamma, particle, layout, seed, cycles):
+    mysimsetup = SimulationSetup()
+    mysimsetup.rows = mysimsetup.cols = size
+    mysimsetup.genotype = genotype
+    mysimsetup.phenotype = phenotype
+    mysimsetup.environment = environment
+    mysimsetup.xray = xray
+    mysimsetup.gamma = gamma
+    mysimsetup.particle = particle
+    mysimsetup.cycles = cycles
+    mysimsetup.start = [(size // 2, size // 2)]
+    nutrient_density, obstacle_density = ParameterSweep.LAYOUTS[layout]
+    free = [(row, col) for row in range(size) for col in range(size) if (row, col) not in mysimsetup.start]
+    layout_random = random.Random(seed)
+    layout_random.shuffle(free)
+    nutrient_count = int(size * size * nutrient_density)
+    obstacle_count = int(size * size * obstacle_density)
+    mysimsetup.nutrients = free[:nutrient_count]
+    mysimsetup.obstacles = free[nutrient_count:nutrient_count + obstacle_count]
+    return mysimsetup
+    #  Builds a setup without prompts, the start point is the centre of the grid
+    #  Nutrients and obstacles are scattered using the seed so the layout can be repeated
+
+
+def run_sweep_configuration(configuration):
+    parameters = {name: configuration[name] for name in ParameterSweep.FIELDS}
+    mysimsetup = setup_from_parameters(cycles = configuration["cycles"], **parameters)
+    run_seed = derive_seed(*(parameters[name] for name in ParameterSweep.FIELDS))
+    mymetrics = MetricsCollector(configuration["metrics_every"]) if configuration.get("metrics_every") else None
+    began = time.perf_counter()
+    if configuration.get("cache"):
+        result = cached_result(configuration["cache"], mysimsetup, run_seed, configuration["engine"])
+    else:
+        hooks = convergence_hooks(configuration.get("stop_when", ()), **configuration.get("stop_options", {}))
+        if mymetrics is not None:
+            hooks.append(mymetrics)
+        result = run_headless(mysimsetup, engine = configuration["engine"], seed = run_seed, cycle_hooks = hooks).to_dict()
+    row = dict(configuration)
+    row.update({
+        "run_seed": run_seed,
+        "final_population": len(result["cells"]),
+        "nutrients_remaining": result["nutrient_count"],
+        "mutation_count": result["mutation_count"],
+        "original_growth_value": result["original_growth_value"],
+        "growth_value": result["growth_value"],
+        "cycle_count": result["cycle_count"],
+        "extinct": result["extinct"],
+        "stop_reason": result["stop_reason"],
+        "seconds": round(time.perf_counter() - began, 6),
+    })
+    if configuration.get("record"):
+        row["record"] = result_record(mysimsetup, result, engine = configuration["engine"], seconds = row["seconds"],
+                                      metrics = mymetrics.rows if mymetrics is not None else None,
+                                      layout = configuration["layout"], layout_seed = configuration["seed"])
+    return row
+    #  Runs in a worker process, so it has to stay a module level function
+    #  Cached runs have no per-cycle metrics, only their results are stored
+    #  The run seed comes from the parameters and seed, never from the worker, so any row can be re-run alone
+
+
+class BenchmarkSuite:
+    def __init__(self, sizes = (10, 50, 100), layouts = ("sparse", "dense"), cycles = (1000, 10000), engines = None, seed = 0):
+        self.sizes = list(sizes)
+        self.layouts = list(layouts)
+        self.cycles = list(cycles)
+        self.engines = list(engines) if engines else self.available_engines()
+        self.seed = seed
+
+    def available_engines(self):
+        engines = ["sequential"]
+        try:
+            require_numpy("The vectorised engine")
+            engines.append("vectorised")
+        except ImportError:
+            pass
+        return engines
+
+    def scenarios(self):
+        for engine in self.engines:
+            for size in self.sizes:
+                for layout in self.layouts:
+                    for cycles in self.cycles:
+                        yield {"name": f"{engine}-{size}-{layout}-{cycles}", "engine": engine,
+                               "size": size, "layout": layout, "cycles": cycles}
+
+    def run(self):
+        results = [self.run_scenario(scenario) for scenario in self.scenarios()]
+        return {"meta": self.__meta(), "results": results}
+
+    def run_scenario(self, scenario):
+        phases = {"setup": 0.0, "run": 0.0}
+        cycles_done = 0
+        cell_updates = 0
+        runs = 0
+        while cycles_done < scenario["cycles"]:
+            began = time.perf_counter()
+            mysimsetup = setup_from_parameters(scenario["size"], 1, 1, 1, 0.01, 0.01, 0.01, scenario["layout"],
+                                               self.seed, scenario["cycles"] - cycles_done)
+            mysimulation = create_simulation(mysimsetup, engine = scenario["engine"], seed = derive_seed(self.seed, scenario["name"], runs))
+            ready = time.perf_counter()
+            mysimulation.run_headless()
+            phases["setup"] = phases["setup"] + (ready - began)
+            phases["run"] = phases["run"] + (time.perf_counter() - ready)
+            cycles_done = cycles_done + max(1, mysimulation.cycle_count)
+            cell_updates = cell_updates + getattr(mysimulation, "cell_updates", mysimulation.cycle_count)
+            runs = runs + 1
+        #  Colonies often die out early, so fresh seeded runs are chained until the cycle count is reached
+        result = dict(scenario)
+        result.update({
+            "runs": runs,
+            "cycles_done": cycles_done,
+            "cell_updates": cell_updates,
+            "seconds": round(phases["setup"] + phases["run"], 6),
+            "cycles_per_second": round(cycles_done / phases["run"], 1) if phases["run"] else None,
+            "cell_updates_per_second": round(cell_updates / phases["run"], 1) if phases["run"] else None,
+            "peak_memory_bytes": self.__peak_memory(scenario),
+            "phases": {name: round(seconds, 6) for name, seconds in phases.items()},
+            "loop_phases": self.__loop_phases(scenario),
+        })
+        return result
+
+    def __loop_phases(self, scenario):
+        mysimsetup = setup_from_parameters(scenario["size"], 1, 1, 1, 0.01, 0.01, 0.01, scenario["layout"],
+                                           self.seed, scenario["cycles"])
+        myinstrumentation = Instrumentation()
+        myinstrumentation.run(myinstrumentation.attach(create_simulation(mysimsetup, engine = scenario["engine"], seed = self.seed)))
+        return myinstrumentation.summary()["phases"]
+        #  Share of time in each part of the loop, from one instrumented run
+
+    def __peak_memory(self, scenario):
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            mysimsetup = setup_from_parameters(scenario["size"], 1, 1, 1, 0.01, 0.01, 0.01, scenario["layout"],
+                                               self.seed, scenario["cycles"])
+            create_simulation(mysimsetup, engine = scenario["engine"], seed = self.seed).run_headless()
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        #  Measured in a separate run because tracemalloc slows the timed runs down a lot
+
+    def __meta(self):
+        import platform
+        meta = {"python": platform.python_version(), "platform": platform.platform(),
+                "processor": platform.processor(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        if "vectorised" in self.engines:
+            meta["numpy"] = require_numpy("The vectorised engine").__version__
+        return meta
+
+    def compare(self, report, baseline, tolerance = 0.2):
+        previous = {result["name"]: result for result in baseline["results"]}
+        regressions = []
+        for result in report["results"]:
+            old = previous.get(result["name"])
+            if old is None or not old.get("cycles_per_second") or not result.get("cycles_per_second"):
+                continue
+            ratio = result["cycles_per_second"] / old["cycles_per_second"]
+            result["baseline_ratio"] = round(ratio, 3)
+            if ratio < 1 - tolerance:
+                regressions.append(result["name"])
+        report["regressions"] = regressions
+        return regressions
+        #  A scenario regresses when it is more than tolerance slower than the baseline
+
+
+class RunningStats:
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.__m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        self.count = self.count + 1
+        delta = value - self.mean
+        self.mean = self.mean + delta / self.count
+        self.__m2 = self.__m2 + delta * (value - self.mean)
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+        #  Welford's method, the mean and variance are updated without keeping the values
+
+    def variance(self):
+        return self.__m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def halfwidth(self, z = 1.96):
+        return z * math.sqrt(self.variance() / self.count) if self.count > 1 else math.inf
+        #  Half the width of the confidence interval for the mean, 95% by default
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.mean, "std": math.sqrt(self.variance()),
+                "ci95": self.halfwidth() if self.count > 1 else None, "min": self.minimum, "max": self.maximum}
+
+
+class P2Quantile:
+    def __init__(self, p):
+        self.p = p
+        self.heights = []
+        self.positions = [1, 2, 3, 4, 5]
+        self.desired = [1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+        #  The P-squared algorithm tracks a quantile with five markers instead of every value
+
+    def add(self, value):
+        heights = self.heights
+        if len(heights) < 5:
+            bisect.insort(heights, value)
+            return
+        positions = self.positions
+        if value < heights[0]:
+            heights[0] = value
+            k = 0
+        elif value >= heights[4]:
+            heights[4] = value
+            k = 3
+        else:
+            k = bisect.bisect_right(heights, value) - 1
+        for i in range(k + 1, 5):
+            positions[i] = positions[i] + 1
+        for i in range(5):
+            self.desired[i] = self.desired[i] + self.increments[i]
+        for i in range(1, 4):
+            offset = self.desired[i] - positions[i]
+            if (offset >= 1 and positions[i + 1] - positions[i] > 1) or (offset <= -1 and positions[i - 1] - positions[i] < -1):
+                step = 1 if offset > 0 else -1
+                height = self.__parabolic(i, step)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + step * (heights[i + step] - heights[i]) / (positions[i + step] - positions[i])
+                heights[i] = height
+                positions[i] = positions[i] + step
+
+    def __parabolic(self, i, step):
+        heights = self.heights
+        positions = self.positions
+        return heights[i] + step / (positions[i + 1] - positions[i - 1]) * (
+            (positions[i] - positions[i - 1] + step) * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i])
+            + (positions[i + 1] - positions[i] - step) * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1]))
+
+    def value(self):
+        if not self.heights:
+            return None
+        if len(self.heights) < 5:
+            return self.heights[round(self.p * (len(self.heights) - 1))]
+        return self.heights[2]
+
+
+class EnsembleRunner:
+    QUANTILES = (0.05, 0.5, 0.95)
+
+    def __init__(self, sim_setup, replicates = 100, seed = 0, engine = "sequential", workers = None,
+                 trajectory_every = 1, target_halfwidth = None, min_replicates = 30):
+        self.sim_setup = sim_setup
+        self.replicates = replicates
+        self.seed = seed
+        self.engine = engine
+        self.workers = workers or os.cpu_count() or 1
+        self.trajectory_every = trajectory_every
+        self.target_halfwidth = target_halfwidth
+        self.min_replicates = min_replicates
+        self.population = RunningStats()
+        self.mutations = RunningStats()
+        self.growth = RunningStats()
+        self.cycles = RunningStats()
+        self.population_quantiles = [P2Quantile(p) for p in self.QUANTILES]
+        self.growth_quantiles = [P2Quantile(p) for p in self.QUANTILES]
+        self.trajectory = []
+        self.extinctions = 0
+        self.stopped_early = False
+        #  Memory depends on the cycle count (one RunningStats per recorded cycle), never on the replicates
+
+    def run(self):
+        import concurrent.futures
+        window = self.workers * 2
+        pending = {}
+        finished = {}
+        submitted = 0
+        added = 0
+        with concurrent.futures.ProcessPoolExecutor(self.workers) as pool:
+            while added < self.replicates and not self.stopped_early:
+                while submitted < self.replicates and submitted - added < window:
+                    future = pool.submit(run_ensemble_replicate, self.sim_setup, self.engine, derive_seed(self.seed, submitted),
+                                         self.trajectory_every)
+                    pending[future] = submitted
+                    submitted = submitted + 1
+                done, waiting = concurrent.futures.wait(pending, return_when = concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    finished[pending.pop(future)] = future.result()
+                while added in finished:
+                    self.add(finished.pop(added))
+                    added = added + 1
+                    if added < self.replicates and self.__converged():
+                        self.stopped_early = True
+                        break
+            for future in pending:
+                future.cancel()
+        return self.summary()
+        #  Only a couple of replicates per worker are submitted or held at once, so huge replicate counts stay cheap
+        #  Results are added in replicate order, replicates that finish early wait until those before them are in
+        #  Convergence is judged on that ordered prefix, so the same ensemble always gives the same numbers
+
+    def __converged(self):
+        if self.target_halfwidth is None or self.population.count < self.min_replicates:
+            return False
+        return self.population.halfwidth() <= self.target_halfwidth
+
+    def add(self, replicate):
+        self.population.add(replicate["population"])
+        self.mutations.add(replicate["mutation_count"])
+        self.growth.add(replicate["growth_value"])
+        self.cycles.add(replicate["cycle_count"])
+        for quantile in self.population_quantiles:
+            quantile.add(replicate["population"])
+        for quantile in self.growth_quantiles:
+            quantile.add(replicate["growth_value"])
+        if replicate["extinct"]:
+            self.extinctions = self.extinctions + 1
+        for position, value in enumerate(replicate["trajectory"]):
+            if position == len(self.trajectory):
+                self.trajectory.append(RunningStats())
+            self.trajectory[position].add(value)
+
+    def summary(self):
+        count = self.population.count
+        return {
+            "replicates": count,
+            "stopped_early": self.stopped_early,
+            "final_population": self.population.to_dict(),
+            "final_population_quantiles": {str(q.p): q.value() for q in self.population_quantiles},
+            "mutation_count": self.mutations.to_dict(),
+            "growth_value": self.growth.to_dict(),
+            "growth_value_quantiles": {str(q.p): q.value() for q in self.growth_quantiles},
+            "cycle_count": self.cycles.to_dict(),
+            "extinction_rate": self.extinctions / count if count else None,
+            "survival_rate": 1 - self.extinctions / count if count else None,
+            "growth_trajectory": [{"cycle": (position + 1) * self.trajectory_every, "runs": stats.count,
+                                   "mean": stats.mean, "std": math.sqrt(stats.variance())}
+                                  for position, stats in enumerate(self.trajectory)],
+        }
+        #  Trajectory points only include replicates still running at that cycle
+
+
+def run_ensemble_replicate(sim_setup, engine, seed, trajectory_every):
+    trajectory = []
+
+    def record(mysimulation):
+        if mysimulation.cycle_count % trajectory_every == 0:
+            trajectory.append(mysimulation.growth_value)
+    result = run_headless(sim_setup, engine = engine, seed = seed, cycle_hooks = [record])
+    return {"population": len(result.cells), "mutation_count": result.mutation_count, "growth_value": result.growth_value,
+            "cycle_count": result.cycle_count, "extinct": result.extinct, "trajectory": trajectory}
+    #  Runs in a worker process and sends back only the numbers the ensemble needs
+
+
+class SimulationCancelled(Exception):
+    pass
+
+
+server_channels = {}
+
+
+def init_server_worker(progress, cancelled):
+    server_channels["progress"] = progress
+    server_channels["cancelled"] = cancelled
+    #  Runs once in each worker process, the queue and the cancel list can only be handed over at start up
+
+
+def run_server_job(job_id, setup_data, options):
+    mysimsetup = SetupFile().from_dict(setup_data, SimulationSetup())
+    mysimulation = create_simulation(mysimsetup, engine = options["engine"], per_cell_growth = options["per_cell_growth"],
+                                     seed = options["seed"])
+    progress = server_channels["progress"]
+    cancelled = server_channels["cancelled"]
+    every = options["progress_every"]
+
+    def report(mysimulation):
+        if mysimulation.cycle_count % every:
+            return
+        if job_id in cancelled:
+            raise SimulationCancelled()
+        progress.put((job_id, {
+            "cycle": mysimulation.cycle_count,
+            "population": mysimulation.population(),
+            "nutrients_remaining": mysimulation.nutrients_remaining(),
+            "growth_value": mysimulation.growth_value,
+            "mutation_count": mysimulation.mutation_count,
+        }))
+    mysimulation.cycle_hooks.append(report)
+    try:
+        result = mysimulation.run_headless()
+    except SimulationCancelled:
+        return {"cancelled": True, "cycle_count": mysimulation.cycle_count}
+    return result.to_dict()
+    #  Cancellation is checked each time progress is sent, so progress_every also sets how quickly a job stops
+
+
+class ServerJob:
+    def __init__(self, job_id, setup_data, options, history):
+        self.job_id = job_id
+        self.setup_data = setup_data
+        self.options = options
+        self.status = "queued"
+        self.result = None
+        self.events = collections.deque(maxlen = history)
+        self.sequence = 0
+        self.updated = None
+        #  Only the latest history events are kept, the final event is always among them
+
+    def finished(self):
+        return self.status in ("done", "cancelled", "failed")
+
+    def to_dict(self):
+        return {"id": self.job_id, "status": self.status, "seed": self.options["seed"], "result": self.result}
+
+
+class SimulationServer:
+    def __init__(self, host = "127.0.0.1", port = 8765, workers = None, max_queued = 256, history = 1000,
+                 max_body = 16 * 1024 * 1024, keep_finished = 1000):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queued = max_queued
+        self.history = history
+        self.max_body = max_body
+        self.keep_finished = keep_finished
+        self.jobs = {}
+        self.__finished = collections.deque()
+        self.__next_id = 1
+        self.__loop = None
+        self.__queue = None
+        self.__pool = None
+        self.__progress = None
+        self.__cancelled = None
+        #  Jobs wait in a bounded asyncio queue, only workers of them are handed to the process pool at a time
+        #  A full queue turns new jobs away with 503 instead of letting them pile up
+        #  Only the latest keep_finished finished jobs are kept, older ones answer 410 Gone
+
+    async def serve(self, ready = None):
+        import asyncio
+        import concurrent.futures
+        import multiprocessing
+        import threading
+        self.__loop = asyncio.get_running_loop()
+        self.__queue = asyncio.Queue(maxsize = self.max_queued)
+        manager = multiprocessing.Manager()
+        self.__cancelled = manager.dict()
+        self.__progress = multiprocessing.Queue()
+        self.__pool = concurrent.futures.ProcessPoolExecutor(self.workers, initializer = init_server_worker,
+                                                             initargs = (self.__progress, self.__cancelled))
+        forwarder = threading.Thread(target = self.__forward_progress, daemon = True)
+        forwarder.start()
+        runners = [asyncio.create_task(self.__run_jobs()) for i in range(self.workers)]
+        server = await asyncio.start_server(self.__handle, self.host, self.port)
+        self.port = server.sockets[0].getsockname()[1]
+        if ready is not None:
+            ready(self)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for runner in runners:
+                runner.cancel()
+            self.__pool.shutdown(wait = False, cancel_futures = True)
+            self.__progress.put(None)
+            manager.shutdown()
+        #  Runs until the task is cancelled (Ctrl+C with asyncio.run)
+        #  ready is called with the server once it is listening, useful when port 0 picks a free port
+
+    def __forward_progress(self):
+        while True:
+            item = self.__progress.get()
+            if item is None:
+                return
+            job_id, progress = item
+            self.__loop.call_soon_threadsafe(self.__progress_event, job_id, progress)
+        #  Reading the worker queue blocks, so it is done on a thread and handed to the event loop
+
+    def __progress_event(self, job_id, progress):
+        job = self.jobs.get(job_id)
+        if job is not None and job.status == "running":
+            self.__add_event(job, "progress", progress)
+        #  Progress can arrive after the result, it is dropped once the job has finished
+
+    def __add_event(self, job, event, data = None):
+        import asyncio
+        job.sequence = job.sequence + 1
+        job.events.append((job.sequence, dict({"event": event, "job": job.job_id}, **(data or {}))))
+        if job.updated is not None:
+            job.updated.set()
+        job.updated = asyncio.Event()
+        #  Each event wakes the streams waiting on the previous one and leaves a fresh one for the next
+
+    async def __run_jobs(self):
+        while True:
+            job = await self.__queue.get()
+            if job.status != "queued":
+                continue
+            job.status = "running"
+            self.__add_event(job, "started")
+            try:
+                result = await self.__loop.run_in_executor(self.__pool, run_server_job, job.job_id, job.setup_data, job.options)
+            except Exception as e:
+                job.status = "failed"
+                job.result = {"error": str(e)}
+            else:
+                job.status = "cancelled" if result.get("cancelled") else "done"
+                job.result = result
+            job.setup_data = None
+            self.__add_event(job, job.status, {"result": job.result})
+            self.__retire(job)
+            await self.__loop.run_in_executor(None, self.__cancelled.pop, job.job_id, None)
+        #  The simulation runs in the process pool, the event loop only waits for it
+        #  The cancel list lives in a manager process, so it is updated off the event loop too
+
+    def __retire(self, job):
+        self.__finished.append(job.job_id)
+        while len(self.__finished) > self.keep_finished:
+            del self.jobs[self.__finished.popleft()]
+        #  Finished jobs hold their whole result, so the oldest are let go once there are too many
+        #  Streams that are still sending a removed job keep their own reference to it
+
+    def __removed(self, job_id):
+        return job_id.isdigit() and 0 < int(job_id) < self.__next_id and job_id not in self.jobs
+        #  Ids are handed out in order, so any earlier id that is no longer held was removed
+
+    async def __handle(self, reader, writer):
+        import asyncio
+        try:
+            request_line = await reader.readline()
+            method, target = request_line.decode("latin-1").split()[:2]
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, value = line.decode("latin-1").split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", 0))
+            if length > self.max_body:
+                await self.__respond(writer, 413, {"error": "request body too large"})
+                return
+            body = await reader.readexactly(length)
+            await self.__route(method, target.split("?")[0].strip("/").split("/"), body, writer)
+        except (ValueError, asyncio.IncompleteReadError):
+            await self.__respond(writer, 400, {"error": "malformed request"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+        #  One request per connection, enough for a local service
+
+    async def __route(self, method, path, body, writer):
+        if path == ["jobs"] and method == "POST":
+            await self.__submit(body, writer)
+        elif path == ["jobs"] and method == "GET":
+            await self.__respond(writer, 200, {"jobs": [{"id": job.job_id, "status": job.status} for job in self.jobs.values()],
+                                               "queued": self.__queue.qsize()})
+        elif len(path) in (2, 3) and path[0] == "jobs" and path[1] in self.jobs:
+            job = self.jobs[path[1]]
+            if len(path) == 3 and path[2] == "events" and method == "GET":
+                await self.__stream(job, writer)
+            elif len(path) == 2 and method == "GET":
+                await self.__respond(writer, 200, job.to_dict())
+            elif len(path) == 2 and method == "DELETE":
+                await self.__cancel(job, writer)
+            else:
+                await self.__respond(writer, 405, {"error": "method not allowed"})
+        elif len(path) in (2, 3) and path[0] == "jobs" and self.__removed(path[1]):
+            await self.__respond(writer, 410, {"error": f"job {path[1]} finished and is no longer kept"})
+        else:
+            await self.__respond(writer, 404, {"error": "not found"})
+
+    async def __submit(self, body, writer):
+        try:
+            payload = json.loads(body)
+            setup_data = payload["setup"]
+            SetupFile().from_dict(setup_data, SimulationSetup())
+            options = {
+                "engine": payload.get("engine", "sequential"),
+                "per_cell_growth": bool(payload.get("per_cell_growth", False)),
+                "seed": int(payload["seed"]) if payload.get("seed") is not None else new_seed(),
+                "progress_every": max(1, int(payload.get("progress_every", 100))),
+            }
+            if options["engine"] not in ("sequential", "vectorised"):
+                raise ValueError(f"unknown engine '{options['engine']}'")
+        except (ValueError, KeyError, TypeError) as e:
+            await self.__respond(writer, 400, {"error": f"invalid job: {e}"})
+            return
+        if self.__queue.full():
+            await self.__respond(writer, 503, {"error": "job queue is full, try again later"}, headers = {"Retry-After": "1"})
+            return
+        job = ServerJob(str(self.__next_id), setup_data, options, self.history)
+        self.__next_id = self.__next_id + 1
+        self.jobs[job.job_id] = job
+        self.__add_event(job, "queued")
+        self.__queue.put_nowait(job)
+        await self.__respond(writer, 202, {"id": job.job_id, "status": job.status, "seed": options["seed"],
+                                           "position": self.__queue.qsize()})
+        #  The setup is checked here so a bad one is rejected straight away rather than failing in a worker
+        #  The seed is fixed when the job is accepted so it can be rerun exactly
+
+    async def __cancel(self, job, writer):
+        if job.finished():
+            await self.__respond(writer, 409, {"error": f"job already {job.status}"})
+            return
+        if job.status == "queued":
+            job.status = "cancelled"
+            self.__add_event(job, "cancelled", {"result": None})
+            self.__retire(job)
+        else:
+            await self.__loop.run_in_executor(None, self.__cancelled.__setitem__, job.job_id, True)
+        await self.__respond(writer, 202, {"id": job.job_id, "status": job.status})
+        #  A queued job is dropped when a runner reaches it, a running one stops at its next progress report
+
+    async def __stream(self, job, writer):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                     b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+        sent = 0
+        while True:
+            waiting = job.updated
+            for sequence, event in list(job.events):
+                if sequence > sent:
+                    line = (json.dumps(event) + "\n").encode()
+                    writer.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                    sent = sequence
+            await writer.drain()
+            if job.finished():
+                break
+            await waiting.wait()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        #  Sends the events kept so far, then each new one as it happens, one JSON object per line
+        #  The stream ends after the job's final event, which carries the result
+
+    async def __respond(self, writer, status, payload, headers = None):
+        from http import HTTPStatus
+        body = json.dumps(payload).encode()
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", "Content-Type: application/json",
+                 f"Content-Length: {len(body)}", "Connection: close"]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+
+def parse_values(text, kind):
+    values = []
+    for item in text.split(","):
+        if ":" in item:
+            start, stop, step = (kind(part) for part in item.split(":"))
+            value = start
+            while value <= stop + step / 1000:
+                values.append(round(value, 6) if kind is float else value)
+                value = value + step
+        else:
+            values.append(kind(item))
+    return values
+    #  Accepts "1,2,5" or inclusive ranges like "0:1:0.25"
+
+
+def add_stop_arguments(parser):
+    parser.add_argument("--stop-when", help = "end runs early on any of: " + ",".join(CONVERGENCE_DETECTORS))
+    parser.add_argument("--stop-check-every", type = int, default = 50, help = "cycles between saturation checks")
+    parser.add_argument("--plateau-cycles", type = int, default = 500, help = "cycles the population must hold steady for 'plateau'")
+    parser.add_argument("--plateau-tolerance", type = int, default = 0, help = "cells the population may drift by and still count as steady")
+    parser.add_argument("--low-growth", type = float, default = 0.05, help = "growth value counted as low for 'low-growth'")
+    parser.add_argument("--low-growth-cycles", type = int, default = 200, help = "cycles in a row the growth value must stay low")
+
+
+def stop_arguments(args):
+    names = [name.strip() for name in args.stop_when.split(",") if name.strip()] if args.stop_when else []
+    options = {"every": args.stop_check_every, "plateau_cycles": args.plateau_cycles, "plateau_tolerance": args.plateau_tolerance,
+               "growth_threshold": args.low_growth, "growth_cycles": args.low_growth_cycles}
+    try:
+        convergence_hooks(names, **options)
+    except ValueError as e:
+        build_parser().error(str(e))
+    return names, options
+    #  Shared by headless runs and sweeps, bad names are reported before anything runs
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description = "Evolution Simulator")
+    parser.add_argument("--headless", action = "store_true", help = "run without prompts, delays or grid output")
+    parser.add_argument("--setup", help = "setup file to run, other options change its values "
+                                           "(without it a 10x10 default setup is built from the other options)")
+    parser.add_argument("--size", type = int, help = "grid size, builds a setup without prompts (or changes the --setup one)")
+    parser.add_argument("--genotype", type = int, choices = range(1, 6), help = "genotype 1-5")
+    parser.add_argument("--phenotype", type = int, choices = range(1, 6), help = "phenotype 1-5")
+    parser.add_argument("--environment", type = int, choices = range(1, 6), help = "environment 1-5")
+    parser.add_argument("--radiation", help = "x-ray, gamma and particle values 0-1, one value for all or three separated by commas")
+    parser.add_argument("--start", action = "append", help = "start point as row,col (repeat for more)")
+    parser.add_argument("--nutrients-file", help = "nutrient coordinates, a .json list or one row,col pair per line")
+    parser.add_argument("--obstacles-file", help = "obstacle coordinates, same format as --nutrients-file")
+    parser.add_argument("--cycles", type = int, help = "number of cycles")
+    parser.add_argument("--neighbourhood", choices = list(Neighbourhood.KINDS), help = "squares a cell can grow into (default: moore)")
+    parser.add_argument("--wrap", action = "store_true", default = None, help = "join opposite grid edges so cells can grow across them")
+    parser.add_argument("--engine", choices = ["sequential", "vectorised"], default = "sequential", help = "simulation engine for headless runs")
+    parser.add_argument("--per-cell-growth", action = "store_true", help = "give each cell its own growth value, inherited by its daughters")
+    parser.add_argument("--seed", type = int, help = "seed for a headless run (random if not given)")
+    parser.add_argument("--nutrient-field", action = "store_true", help = "spread food as a diffusing, regrowing field")
+    parser.add_argument("--diffusion", type = float, default = 0.1, help = "nutrient field diffusion rate (0-0.25)")
+    parser.add_argument("--regrowth", type = float, default = 0.01, help = "nutrient field regrowth rate per step")
+    parser.add_argument("--field-every", type = int, default = 1, help = "cycles between field updates (sequential engine)")
+    parser.add_argument("--world-size", type = int, help = "replace the setup's grid with a generated world this wide (0 = unbounded)")
+    parser.add_argument("--nutrient-density", type = float, default = 0.05, help = "share of squares given nutrients in a generated world")
+    parser.add_argument("--obstacle-density", type = float, default = 0.02, help = "share of squares given obstacles in a generated world")
+    parser.add_argument("--clusters", type = int, default = 0, help = "nutrient clusters in a generated world")
+    parser.add_argument("--walls", type = int, default = 0, help = "walls in a generated world")
+    parser.add_argument("--checkpoint", help = "file to write periodic checkpoints to (headless sequential runs)")
+    parser.add_argument("--checkpoint-every", type = int, help = "cycles between checkpoints (default 1000)")
+    parser.add_argument("--checkpoint-seconds", type = float, help = "seconds between checkpoints")
+    parser.add_argument("--resume", help = "continue a run from a checkpoint file")
+    parser.add_argument("--telemetry", help = "write per-cycle statistics to a .csv, .jsonl or .parquet file")
+    parser.add_argument("--telemetry-every", type = int, default = 1, help = "record every Nth cycle")
+    parser.add_argument("--history", help = "record every cycle to a binary log for the replay command (not for --world-size)")
+    parser.add_argument("--keyframe-every", type = int, default = 100, help = "cycles between full snapshots in the history log")
+    parser.add_argument("--cache", help = "SQLite result cache for headless runs (needs --seed)")
+    parser.add_argument("--cache-size", type = int, default = 256, help = "result cache size limit in MB")
+    parser.add_argument("--store", help = "SQLite results database to add a headless run to")
+    parser.add_argument("--store-label", help = "label saved with the run in --store, for picking runs out later")
+    parser.add_argument("--metrics-every", type = int, default = 1, help = "cycles between per-cycle rows in --store (0 = results only)")
+    add_stop_arguments(parser)
+    parser.add_argument("--instrument", action = "store_true", help = "time each phase and count events, summary goes to stderr")
+    parser.add_argument("--cprofile", action = "store_true", help = "add a cProfile report to the instrumentation summary")
+    parser.add_argument("--trace-memory", action = "store_true", help = "add tracemalloc peak and top allocations to the summary")
+    subparsers = parser.add_subparsers(dest = "command")
+    convert = subparsers.add_parser("convert", help = "convert a setup file to .json or .npz")
+    convert.add_argument("source")
+    convert.add_argument("destination")
+    sweep = subparsers.add_parser("sweep", help = "run every combination of the given parameters in parallel")
+    sweep.add_argument("--size", default = "10", help = "grid sizes, e.g. 10,20 or 10:50:10")
+    sweep.add_argument("--genotype", default = "5", help = "genotypes 1-5")
+    sweep.add_argument("--phenotype", default = "5", help = "phenotypes 1-5")
+    sweep.add_argument("--environment", default = "5", help = "environments 1-5")
+    sweep.add_argument("--xray", default = "0.01", help = "x-ray values 0-1")
+    sweep.add_argument("--gamma", default = "0.01", help = "gamma values 0-1")
+    sweep.add_argument("--particle", default = "0.01", help = "particle values 0-1")
+    sweep.add_argument("--layout", default = "sparse", help = "nutrient/obstacle layouts: " + ",".join(ParameterSweep.LAYOUTS))
+    sweep.add_argument("--seed", default = "0", help = "seeds, e.g. 0:99:1")
+    sweep.add_argument("--cycles", type = int, default = 100)
+    sweep.add_argument("--engine", choices = ["sequential", "vectorised"], default = "sequential")
+    sweep.add_argument("--sample", type = int, help = "run a random subset of this many combinations")
+    sweep.add_argument("--workers", type = int, help = "worker processes (default: all cores)")
+    sweep.add_argument("--chunksize", type = int, help = "runs sent to a worker at a time")
+    sweep.add_argument("--output", default = "sweep_results.csv", help = "results file, .parquet for a columnar file, anything else is CSV")
+    sweep.add_argument("--cache", help = "SQLite result cache, repeated runs are read from it instead of simulated")
+    sweep.add_argument("--store", help = "SQLite results database to add every run to")
+    sweep.add_argument("--metrics-every", type = int, default = 0, help = "also store every Nth cycle of each run (0 = results only)")
+    add_stop_arguments(sweep)
+    bench = subparsers.add_parser("bench", help = "time the simulation loop on fixed seeded scenarios")
+    bench.add_argument("--sizes", default = "10,50,100")
+    bench.add_argument("--layouts", default = "sparse,dense")
+    bench.add_argument("--cycles", default = "1000,10000")
+    bench.add_argument("--engines", help = "engines to time (default: every available engine)")
+    bench.add_argument("--output", default = "bench_results.json")
+    bench.add_argument("--baseline", help = "earlier results to compare against")
+    bench.add_argument("--tolerance", type = float, default = 0.2, help = "allowed slowdown before a regression is reported")
+    serve = subparsers.add_parser("serve", help = "run a local HTTP service that queues and runs simulations")
+    serve.add_argument("--host", default = "127.0.0.1")
+    serve.add_argument("--port", type = int, default = 8765)
+    serve.add_argument("--workers", type = int, help = "simulations run at once (default: all cores)")
+    serve.add_argument("--max-queued", type = int, default = 256, help = "jobs that can wait before new ones are turned away")
+    serve.add_argument("--keep-finished", type = int, default = 1000, help = "finished jobs kept for fetching, older ones are removed")
+    replay = subparsers.add_parser("replay", help = "play back a run recorded with --history")
+    replay.add_argument("history")
+    replay.add_argument("--start", type = int, help = "first cycle to show (default: the first recorded)")
+    replay.add_argument("--end", type = int, help = "last cycle to show (default: the last recorded)")
+    replay.add_argument("--step", type = int, default = 1, help = "cycles per frame, negative to play backwards")
+    replay.add_argument("--fps", type = float, default = 10)
+    replay.add_argument("--window", help = "area to show as row,col,rows,cols (needed for unbounded worlds)")
+    ensemble = subparsers.add_parser("ensemble", help = "run many seeded replicates of one setup and summarise them")
+    ensemble.add_argument("--setup", required = True)
+    ensemble.add_argument("--replicates", type = int, default = 100)
+    ensemble.add_argument("--seed", type = int, default = 0)
+    ensemble.add_argument("--engine", choices = ["sequential", "vectorised"], default = "sequential")
+    ensemble.add_argument("--workers", type = int)
+    ensemble.add_argument("--trajectory-every", type = int, default = 1, help = "record the growth value every Nth cycle")
+    ensemble.add_argument("--target-halfwidth", type = float, help = "stop once the 95%% interval of mean final population is this narrow")
+    ensemble.add_argument("--min-replicates", type = int, default = 30)
+    ensemble.add_argument("--output", help = "write the summary JSON here instead of printing it")
+    results = subparsers.add_parser("results", help = "summarise or export runs saved with --store")
+    results.add_argument("store")
+    results.add_argument("--group-by", default = "genotype,environment", help = "columns to group runs by, comma separated")
+    results.add_argument("--metric", default = "final_population", help = "column to summarise")
+    results.add_argument("--where", action = "append", default = [], help = "only runs with column=value (repeat for more)")
+    results.add_argument("--export", help = "write the matching runs to a .csv or .jsonl file instead")
+    return parser
+
+
+def setup_from_arguments(args):
+    mybuilder = SetupBuilder(PreviousSetup().load(args.setup) if args.setup else None)
+    if args.size is not None:
+        mybuilder.size(args.size)
+    for name in ("genotype", "phenotype", "environment", "cycles"):
+        if getattr(args, name) is not None:
+            getattr(mybuilder, name)(getattr(args, name))
+    if args.radiation is not None:
+        radiation = parse_values(args.radiation, float)
+        if len(radiation) not in (1, 3):
+            raise ValueError("--radiation takes one value or three (x-ray, gamma, particle)")
+        mybuilder.radiation(*radiation)
+    if args.start:
+        mybuilder.start(*[parse_values(coordinate, int) for coordinate in args.start])
+    if args.nutrients_file:
+        mybuilder.nutrients_file(args.nutrients_file)
+    if args.obstacles_file:
+        mybuilder.obstacles_file(args.obstacles_file)
+    if args.neighbourhood is not None or args.wrap is not None:
+        mybuilder.neighbourhood(args.neighbourhood, wrap = args.wrap)
+    return mybuilder.build()
+    #  Options given on the command line replace the matching values from --setup
+
+
+def run_ensemble_command(args):
+    myensemble = EnsembleRunner(PreviousSetup().load(args.setup), replicates = args.replicates, seed = args.seed,
+                                engine = args.engine, workers = args.workers, trajectory_every = args.trajectory_every,
+                                target_halfwidth = args.target_halfwidth, min_replicates = args.min_replicates)
+    summary = myensemble.run()
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(summary, file, indent = 2)
+        print(f"{summary['replicates']} replicates summarised in {args.output}")
+    else:
+        print(json.dumps(summary, indent = 2))
+
+
+def run_bench_command(args):
+    mybenchmark = BenchmarkSuite(
+        sizes = parse_values(args.sizes, int),
+        layouts = args.layouts.split(","),
+        cycles = parse_values(args.cycles, int),
+        engines = args.engines.split(",") if args.engines else None,
+    )
+    report = mybenchmark.run()
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            regressions = mybenchmark.compare(report, json.load(file), tolerance = args.tolerance)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent = 2)
+    for result in report["results"]:
+        line = (f"{result['name']:<32} {result['cycles_per_second']:>12} cycles/s "
+                f"{result['cell_updates_per_second']:>12} cell updates/s  peak {result['peak_memory_bytes']} B")
+        if "baseline_ratio" in result:
+            line = line + f"  x{result['baseline_ratio']}"
+        print(line)
+    if regressions:
+        print(f"Regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+def run_serve_command(args):
+    import asyncio
+    myserver = SimulationServer(host = args.host, port = args.port, workers = args.workers, max_queued = args.max_queued,
+                                keep_finished = args.keep_finished)
+    try:
+        asyncio.run(myserver.serve(ready = lambda server: print(f"Serving on http://{server.host}:{server.port}", flush = True)))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_replay_command(args):
+    myreplay = HistoryReplay(args.history)
+    window = tuple(int(value) for value in args.window.split(",")) if args.window else None
+    size = window[2:] if window is not None else (myreplay.rows, myreplay.cols)
+    if None in size:
+        build_parser().error("--window is needed to replay an unbounded world")
+    try:
+        myreplay.play(start = args.start, end = args.end, step = args.step, window = window,
+                      renderer = TerminalRenderer(size[0], size[1], max_fps = args.fps))
+    except IndexError as e:
+        build_parser().error(str(e))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        myreplay.close()
+
+
+def run_results_command(args):
+    where = {}
+    for condition in args.where:
+        name, separator, value = condition.partition("=")
+        if not separator:
+            build_parser().error(f"--where takes column=value, not '{condition}'")
+        value = value.strip()
+        for kind in (int, float):
+            try:
+                value = kind(value)
+                break
+            except ValueError:
+                pass
+        where.setdefault(name.strip(), []).append(value)
+    with ResultsStore(args.store) as mystore:
+        try:
+            if args.export:
+                count = mystore.export(args.export, where = where)
+                print(f"{count} runs written to {args.export}")
+            else:
+                group_by = [name.strip() for name in args.group_by.split(",") if name.strip()]
+                print(json.dumps(mystore.aggregate(group_by, args.metric, where = where), indent = 2))
+        except ValueError as e:
+            build_parser().error(str(e))
+    #  Values that look like numbers are compared as numbers
+    #  Repeating --where with the same column matches any of its values
+
+
+def run_sweep_command(args):
+    stop_when, stop_options = stop_arguments(args)
+    if stop_when and args.cache:
+        build_parser().error("--stop-when cannot be combined with --cache, cached results are for full runs")
+    mysweep = ParameterSweep(
+        sizes = parse_values(args.size, int),
+        genotypes = parse_values(args.genotype, int),
+        phenotypes = parse_values(args.phenotype, int),
+        environments = parse_values(args.environment, int),
+        xrays = parse_values(args.xray, float),
+        gammas = parse_values(args.gamma, float),
+        particles = parse_values(args.particle, float),
+        layouts = args.layout.split(","),
+        seeds = parse_values(args.seed, int),
+        cycles = args.cycles,
+        engine = args.engine,
+        samples = args.sample,
+        cache = args.cache,
+        store = args.store,
+        metrics_every = args.metrics_every,
+        stop_when = stop_when,
+        stop_options = stop_options,
+    )
+    began = time.perf_counter()
+    completed = mysweep.run(args.output, workers = args.workers, chunksize = args.chunksize)
+    print(f"{completed} runs written to {args.output} in {round(time.perf_counter() - began, 2)}s")
+
+
+def main(argv = None):
+    args = build_parser().parse_args(argv)
+    if args.command == "sweep":
+        run_sweep_command(args)
+        return
+    if args.command == "ensemble":
+        run_ensemble_command(args)
+        return
+    if args.command == "results":
+        run_results_command(args)
+        return
+    if args.command == "bench":
+        run_bench_command(args)
+        return
+    if args.command == "replay":
+        run_replay_command(args)
+        return
+    if args.command == "serve":
+        run_serve_command(args)
+        return
+    if args.command == "convert":
+        SetupFile().convert(args.source, args.destination)
+        print(f"Converted {args.source} to {args.destination}")
+        return
+    if args.resume:
+        mysimulation = load_checkpoint(args.resume)
+        stop_when, stop_options = stop_arguments(args)
+        mysimulation.cycle_hooks.extend(convergence_hooks(stop_when, **stop_options))
+        run_headless_command(args, mysimulation, mysimulation.sim_setup.copy())
+        return
+    setup_options = ("setup", "size", "genotype", "phenotype", "environment", "radiation", "start",
+                     "nutrients_file", "obstacles_file", "cycles", "neighbourhood", "wrap")
+    if not args.headless and all(getattr(args, name) is None for name in setup_options):
+        simulator = EvolutionSimulator()
+        simulator.main()
+        return
+    if args.checkpoint and args.engine != "sequential":
+        build_parser().error("--checkpoint only works with the sequential engine")
+    try:
+        mysimsetup = setup_from_arguments(args)
+    except (SetupFormatError, ValueError, OSError) as e:
+        build_parser().error(str(e))
+    stop_when, stop_options = stop_arguments(args)
+    if not args.headless:
+        if mysimsetup.colonies:
+            build_parser().error("multi-colony setups only run headless, add --headless")
+        EvolutionSimulator().run(mysimsetup, seed = args.seed, cycle_hooks = convergence_hooks(stop_when, **stop_options))
+        return
+    if (args.checkpoint or args.history) and mysimsetup.colonies:
+        build_parser().error("--checkpoint and --history do not support multi-colony setups yet")
+    if args.history and args.world_size is not None:
+        build_parser().error("--history does not support --world-size worlds yet")
+    if args.world_size == 0 and mysimsetup.wrap:
+        build_parser().error("--wrap needs a grid with edges, not --world-size 0")
+    if args.world_size is not None:
+        size = args.world_size or None
+        mysimsetup = world_setup(mysimsetup, size, size, nutrient_density = args.nutrient_density,
+                                 obstacle_density = args.obstacle_density, clusters = args.clusters,
+                                 walls = args.walls, seed = args.seed or 0)
+    nutrient_field = None
+    if args.nutrient_field:
+        nutrient_field = {"diffusion": args.diffusion, "regrowth": args.regrowth, "every": args.field_every}
+    try:
+        check_simulation_options(mysimsetup, engine = args.engine, per_cell_growth = args.per_cell_growth,
+                                 nutrient_field = nutrient_field)
+    except ValueError as e:
+        build_parser().error(str(e))
+    if args.cache:
+        if args.seed is None:
+            build_parser().error("--cache needs --seed, results for random seeds are never asked for again")
+        if args.checkpoint or args.telemetry or args.history or args.store or args.instrument or args.cprofile or args.trace_memory:
+            build_parser().error("--cache cannot be combined with options that watch the run")
+        if stop_when:
+            build_parser().error("--stop-when cannot be combined with --cache, cached results are for full runs")
+        mycache = ResultCache(args.cache, max_bytes = args.cache_size * 1024 * 1024)
+        try:
+            print(json.dumps(mycache.run(mysimsetup, args.seed, engine = args.engine, per_cell_growth = args.per_cell_growth,
+                                         nutrient_field = nutrient_field)))
+            print(f"Cache: {json.dumps(mycache.summary())}", file = sys.stderr)
+        finally:
+            mycache.close()
+        return
+    mysimulation = create_simulation(mysimsetup, engine = args.engine, per_cell_growth = args.per_cell_growth, seed = args.seed,
+                                     nutrient_field = nutrient_field)
+    mysimulation.cycle_hooks.extend(convergence_hooks(stop_when, **stop_options))
+    run_headless_command(args, mysimulation, mysimsetup)
+
+
+def run_headless_command(args, mysimulation, sim_setup):
+    path = args.checkpoint or args.resume
+    mycheckpointer = None
+    mytelemetry = None
+    if path:
+        mycheckpointer = Checkpointer(path, every_cycles = args.checkpoint_every, every_seconds = args.checkpoint_seconds)
+        mysimulation.cycle_hooks.append(mycheckpointer)
+    if args.telemetry:
+        mytelemetry = TelemetryRecorder(args.telemetry, every = args.telemetry_every)
+        mysimulation.cycle_hooks.append(mytelemetry)
+    myhistory = None
+    if args.history:
+        try:
+            myhistory = HistoryRecorder(args.history, mysimulation, keyframe_every = args.keyframe_every)
+        except ValueError as e:
+            build_parser().error(str(e))
+        mysimulation.cycle_hooks.append(myhistory)
+    mymetrics = None
+    if args.store and args.metrics_every:
+        mymetrics = MetricsCollector(args.metrics_every)
+        mysimulation.cycle_hooks.append(mymetrics)
+    myinstrumentation = None
+    if args.instrument or args.cprofile or args.trace_memory:
+        myinstrumentation = Instrumentation(profile = args.cprofile, trace_memory = args.trace_memory)
+        myinstrumentation.attach(mysimulation)
+        myinstrumentation.start()
+    previous_handler = None
+    if mycheckpointer is not None:
+        import signal
+        previous_handler = signal.signal(signal.SIGINT, mycheckpointer.interrupt)
+    began = time.perf_counter()
+    try:
+        result = mysimulation.run_headless()
+    except KeyboardInterrupt:
+        if mycheckpointer is not None:
+            print(f"Interrupted, the last checkpoint in {path} was kept", file = sys.stderr)
+        sys.exit(130)
+    finally:
+        if previous_handler is not None:
+            signal.signal(signal.SIGINT, previous_handler)
+        if mytelemetry is not None:
+            mytelemetry.close()
+        if myhistory is not None:
+            myhistory.close()
+        if myinstrumentation is not None:
+            myinstrumentation.stop()
+            report = myinstrumentation.summary()
+            profile = report.pop("profile", None)
+            print(json.dumps(report, indent = 2), file = sys.stderr)
+            if profile:
+                print(profile, file = sys.stderr)
+    seconds = time.perf_counter() - began
+    if mycheckpointer is not None and mycheckpointer.interrupted:
+        print(f"Interrupted at cycle {mysimulation.cycle_count}, resume with --resume {path}", file = sys.stderr)
+        sys.exit(130)
+    print(json.dumps(result.to_dict()))
+    if args.store:
+        with ResultsStore(args.store) as mystore:
+            run_id = mystore.add_run(sim_setup, result, engine = args.engine, seconds = round(seconds, 6), label = args.store_label,
+                                     metrics = mymetrics.rows if mymetrics is not None else None)
+        print(f"Stored as run {run_id} in {args.store}", file = sys.stderr)
+    if mycheckpointer is not None:
+        mycheckpointer.save(mysimulation)
+        print(f"Checkpoint cost: {json.dumps(mycheckpointer.summary())}", file = sys.stderr)
+    #  A final checkpoint is always written so a finished run can be extended or inspected
+    #  Ctrl-C with --checkpoint only sets a flag, the run stops and saves at the end of the current cycle
+
+
 if __name__ == "__main__":
-    simulator = EvolutionSimulator()
-    simulator.main()
+    main()